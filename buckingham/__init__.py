@@ -19,12 +19,21 @@ http://en.wikipedia.org/wiki/Buckingham_%CF%80_theorem Buckingham
 
 __version__ = 0.3
 
-import re
+import itertools
 import math
+import operator
+import os
+import sys
+import threading
+from collections import OrderedDict, namedtuple
 
-__all__ = ['Number', 'allunits', 'pm', 'exp', 'log', 'sin', 'cos']
+__all__ = ['Number', 'allunits', 'pm', 'exp', 'log', 'sin', 'cos', 'converter',
+           'format_numbers', 'auto_convert', 'fsum', 'Accumulator',
+           'RunningMeasurement', 'memoize']
+
+class Fraction(object):
+    __slots__ = ('n','d')
 
-class Fraction:
     @staticmethod
     def gcd(x, y):
         g = y
@@ -38,8 +47,9 @@ class Fraction:
         self.n,self.d = int(float(z[0])),int(float(z[1]))
         if self.d<0:
             self.n,self.d = -self.n,-self.d
-        m = self.n and self.gcd(abs(self.n),abs(self.d)) or 1
-        self.n, self.d = self.n/m, self.d/m
+        # 0/d is reduced to 0/1
+        m = self.n and self.gcd(abs(self.n),abs(self.d)) or self.d or 1
+        self.n, self.d = self.n//m, self.d//m
     def __add__(self,other):
         if not isinstance(other,Fraction):
             other=Fraction(other)
@@ -132,36 +142,211 @@ UNITS = {
     'fermi':(10.0**-15,1,0,0,0,0,0),
 }
 
+PREFIXES = [
+    ('yocto',10.0**-24),
+    ('zepto',10.0**-21),
+    ('atto',10.0**-18),
+    ('femto',10.0**-15),
+    ('pico',10.0**-12),
+    ('nano',10.0**-9),
+    ('micro',10.0**-6),
+    ('milli',10.0**-3),
+    ('centi',10.0**-2),
+    ('deci',0.1),
+    ('deka',10.0),
+    ('hecto',10.0**2),
+    ('kilo',10.0**3),
+    ('mega',10.0**6),
+    ('giga',10.0**9),
+    ('tera',10.0**12),
+    ('peta',10.0**15),
+    ('exa',10.0**18),
+    ('zetta',10.0**21),
+    ('yotta',10.0**24),
+    ]
+
+# units that do not take a prefix
+UNPREFIXED = ('N','M','T','M','A','K','D','none','None')
+
 def extend_units(units):
-    scales =  [
-        ('yocto',10.0**-24),
-        ('zepto',10.0**-21),
-        ('atto',10.0**-18),
-        ('femto',10.0**-15),
-        ('pico',10.0**-12),
-        ('nano',10.0**-9),
-        ('micro',10.0**-6),
-        ('milli',10.0**-3),
-        ('centi',10.0**-2),
-        ('deci',0.1),
-        ('deka',10.0),
-        ('hecto',10.0**2),
-        ('kilo',10.0**3),
-        ('mega',10.0**6),
-        ('giga',10.0**9),
-        ('tera',10.0**12),
-        ('peta',10.0**15),
-        ('exa',10.0**18),
-        ('zetta',10.0**21),
-        ('yotta',10.0**24),
-        ]
+    """ adds all prefixed names to a dict of units, in place """
     keys = [key for key in units]
-    for name, conversion in scales:
+    for name, conversion in PREFIXES:
         for key in keys:
-            if not key in ('N','M','T','M','A','K','D','none','None'):
+            if not key in UNPREFIXED:
                 v = units[key]
                 units[name+key] = (v[0]*conversion,v[1],v[2],v[3],v[4],v[5],v[6])
-extend_units(UNITS)
+
+def unit_names():
+    """ iterates over all accepted unit names, including prefixed ones """
+    for key in UNITS:
+        yield key
+    for name, conversion in PREFIXES:
+        for key in UNITS:
+            if not key in UNPREFIXED:
+                yield name+key
+
+# name -> (scale, Dimension), filled on first use by lookup_unit
+UNIT_TABLE = {}
+
+def lookup_unit(name):
+    """
+    returns (scale, Dimension) for a unit name, or None if unknown.
+    prefixed names are resolved on first use and cached in UNIT_TABLE
+
+    >>> scale, dims = lookup_unit('kilometer')
+    >>> print('%s %s' % (scale, dims))
+    1000.0 meter
+    >>> lookup_unit('kiloN') is None
+    True
+    """
+    value = UNIT_TABLE.get(name)
+    if value is None:
+        if name in UNITS:
+            v = UNITS[name]
+            value = (v[0],Dimension(v[1:]))
+        else:
+            for prefix, conversion in PREFIXES:
+                if name.startswith(prefix):
+                    key = name[len(prefix):]
+                    if key in UNITS and not key in UNPREFIXED:
+                        v = UNITS[key]
+                        value = (v[0]*conversion,Dimension(v[1:]))
+                        break
+            else:
+                return None
+        UNIT_TABLE[name] = value
+    return value
+
+def _dimension(exponents):
+    return Dimension._intern(exponents)
+
+class Dimension(object):
+    """
+    immutable vector of the exponents of meter, second, gram, ampere,
+    kelvin and currency. exponents are stored as integers in units of
+    1/DENOMINATOR and instances are interned, so equal dimensions are
+    the same object and can be compared with "is".
+
+    >>> speed = Dimension((1,-1,0,0,0,0))
+    >>> speed is Dimension((1,-1,0,0,0,0))
+    True
+    >>> print(speed**0.5)
+    meter^1/2*second^-1/2
+    >>> (speed*Dimension((0,1,0,0,0,0))).units()
+    'meter'
+    """
+    DENOMINATOR = 2520
+    NAMES = ('meter','second','gram','ampere','kelvin','currency')
+    __slots__ = ('exponents',)
+    _interned = {}
+    _products = {}
+    _quotients = {}
+    _powers = {}
+
+    def __new__(cls,exponents):
+        if isinstance(exponents,Dimension):
+            return exponents
+        exponents = tuple(cls._scale(x) for x in exponents)
+        if len(exponents) != 6:
+            raise RuntimeError("Dims must have 6 exponents")
+        return cls._intern(exponents)
+
+    @classmethod
+    def _intern(cls,exponents):
+        self = cls._interned.get(exponents)
+        if self is None:
+            self = object.__new__(cls)
+            self.exponents = exponents
+            self = cls._interned.setdefault(exponents,self)
+        return self
+
+    @classmethod
+    def _scale(cls,x):
+        # converts an exponent to an integer multiple of 1/DENOMINATOR
+        if isinstance(x,Fraction):
+            return cls._integer(float(x.n*cls.DENOMINATOR)/x.d,x)
+        return cls._integer(x*cls.DENOMINATOR,x)
+
+    @staticmethod
+    def _integer(n,x):
+        i = int(round(n))
+        if abs(i-n)>1e-6:
+            raise RuntimeError("Unsupported exponent %s" % x)
+        return i
+
+    def __reduce__(self):
+        return (_dimension,(self.exponents,))
+
+    def __len__(self):
+        return 6
+
+    def __getitem__(self,i):
+        return Fraction(self.exponents[i],self.DENOMINATOR)
+
+    def __iter__(self):
+        for i in range(6):
+            yield self[i]
+
+    @staticmethod
+    def _memo(cache,key,compute):
+        value = cache.get(key)
+        if value is None:
+            if len(cache)>10000:
+                cache.clear()
+            value = cache[key] = compute()
+        return value
+
+    def __mul__(self,other):
+        return self._memo(self._products,(self,other),lambda: self._intern(
+                tuple(a+b for a,b in zip(self.exponents,other.exponents))))
+
+    def __div__(self,other):
+        return self._memo(self._quotients,(self,other),lambda: self._intern(
+                tuple(a-b for a,b in zip(self.exponents,other.exponents))))
+
+    __truediv__ = __div__
+
+    def __pow__(self,other):
+        return self._memo(self._powers,(self,other),lambda: self._intern(
+                tuple(self._integer(a*other,other) for a in self.exponents)))
+
+    def is_pure(self):
+        return self is PURE
+
+    def units(self):
+        if self is PURE:
+            return 'none'
+        r = []
+        for name,n in zip(self.NAMES,self):
+            if n == 0:
+                continue
+            elif n == 1:
+                r.append(name)
+            else:
+                r.append('%s^%s' % (name,n))
+        return '*'.join(r)
+
+    def __str__(self):
+        return self.units()
+
+    def __repr__(self):
+        """
+        >>> speed = Dimension((1,-0.5,0,0,0,0))
+        >>> speed
+        Dimension((1, -0.5, 0, 0, 0, 0))
+        >>> eval(repr(speed)) is speed
+        True
+        >>> str(speed[2])
+        '0'
+        """
+        d = self.DENOMINATOR
+        return 'Dimension((%s))' % ', '.join(
+            str(x//d) if x % d == 0 else repr(float(x)/d)
+            for x in self.exponents)
+
+# canonical dims of a pure number
+PURE = Dimension((0,0,0,0,0,0))
 
 def buckingham(units,d):
     items = units.split('/')
@@ -195,7 +380,451 @@ def int_safe(x):
         return i
     return i-1
 
-class Number:
+# pieces of the output of as_string (plain) and as_latex (latex)
+STYLES = {
+    'plain': dict(exact = '(%f ± 0)', pm = ' ± ',
+                  up = ')x10^%i', up1 = ')x10', down = ')/10^%i', down1 = ')/10'),
+    'latex': dict(exact = '(%f \\pm 0)', pm = ' \\pm ',
+                  up = ')\\times 10^{%i}', up1 = ')\\times 10',
+                  down = ')\\times 10^{-%i}', down1 = ')\\times 10^{-1}'),
+    }
+
+# (style, decimals, exponent) -> format string of (value, error)
+TEMPLATES = {}
+
+def template(style,i,n):
+    """
+    returns the format string for a value and error printed with i
+    decimals and scaled by 10^n, built once per (style, i, n)
+
+    >>> template('plain',3,2)
+    '(%.3f ± %.3f)x10^2'
+    """
+    key = (style,i,n)
+    t = TEMPLATES.get(key)
+    if t is None:
+        pieces = STYLES[style]
+        f = '%.'+str(i)+'f'
+        t = f+pieces['pm']+f
+        if n>1:
+            t = '('+t+pieces['up'] % n
+        elif n>0:
+            t = '('+t+pieces['up1']
+        elif n<-1:
+            t = '('+t+pieces['down'] % -n
+        elif n<0:
+            t = '('+t+pieces['down1']
+        if len(TEMPLATES)>10000:
+            TEMPLATES.clear()
+        TEMPLATES[key] = t
+    return t
+
+def format_number(value,error,style = 'plain',decimals = 2):
+    """
+    formats a value and its error with as many decimals as needed to
+    show two significant digits of the error (and at least decimals)
+
+    >>> format_number(1234.5,6.7)
+    '(1.23450 ± 0.00670)x10^3'
+    >>> print(format_number(0.012,0.001,'latex'))
+    (1.200 \\pm 0.100)\\times 10^{-2}
+    """
+    if not error:
+        return STYLES[style]['exact'] % value
+    n = int_safe(abs(value))
+    m = int_safe(error)
+    scale = 10**n
+    return template(style,max(n-m+2,decimals),n) % (value/scale,error/scale)
+
+def tokenize_units(dims):
+    """
+    splits a unit string into (kind, text, position) tokens where kind is
+    one of 'name', 'int' or the operator itself. spaces are skipped
+
+    >>> [t[1] for t in tokenize_units('meter / second^-2')]
+    ['meter', '/', 'second', '^', '-', '2']
+    """
+    tokens = []
+    i, n = 0, len(dims)
+    while i<n:
+        c = dims[i]
+        if c == ' ':
+            i += 1
+        elif c.isalpha() or c == '_':
+            j = i+1
+            while j<n and (dims[j].isalnum() or dims[j] == '_'):
+                j += 1
+            tokens.append(('name',dims[i:j],i))
+            i = j
+        elif c.isdigit():
+            j = i+1
+            while j<n and dims[j].isdigit():
+                j += 1
+            tokens.append(('int',dims[i:j],i))
+            i = j
+        elif c in '*/^()+-':
+            tokens.append((c,c,i))
+            i += 1
+        else:
+            raise UnitParser.error(dims,i,'unexpected %r' % c)
+    return tokens
+
+class UnitParser(object):
+    """
+    recursive descent parser for the unit grammar
+
+        expression := term (('*' | '/') term)*
+        term       := atom ('^' exponent)?
+        atom       := name | '(' expression ')'
+        exponent   := rational | '(' rational ')'
+        rational   := ('+' | '-')? int ('/' int)?
+
+    names are resolved with lookup_unit. nothing is evaluated, the
+    result is the (scale, Dimension) plan of the whole expression
+    """
+    def __init__(self,dims):
+        self.dims = dims
+        self.tokens = tokenize_units(dims)
+        self.k = 0
+
+    @staticmethod
+    def error(dims,position,message):
+        e = SyntaxError('Invalid Dims: %s at position %i in %r' % (
+                message,position,dims))
+        e.offset, e.text = position+1, dims
+        return e
+
+    def peek(self):
+        if self.k<len(self.tokens):
+            return self.tokens[self.k]
+        return ('end','',len(self.dims))
+
+    def expect(self,kind):
+        token = self.peek()
+        if token[0] != kind:
+            what = 'end of string' if token[0] == 'end' else repr(token[1])
+            raise self.error(self.dims,token[2],'unexpected %s' % what)
+        self.k += 1
+        return token
+
+    def parse(self):
+        plan = self.expression()
+        self.expect('end')
+        return plan
+
+    def expression(self):
+        scale, dims = self.term()
+        while self.peek()[0] in ('*','/'):
+            op = self.expect(self.peek()[0])[0]
+            other_scale, other_dims = self.term()
+            if op == '*':
+                scale, dims = scale*other_scale, dims*other_dims
+            else:
+                scale, dims = scale/other_scale, dims/other_dims
+        return scale, dims
+
+    def term(self):
+        if self.peek()[0] == '(':
+            self.expect('(')
+            scale, dims = self.expression()
+            self.expect(')')
+        else:
+            name, text, position = self.expect('name')
+            value = lookup_unit(text)
+            if value is None:
+                raise RuntimeError("Unknown units %r at position %i in %r" % (
+                        text,position,self.dims))
+            scale, dims = value
+        if self.peek()[0] == '^':
+            self.expect('^')
+            if self.peek()[0] == '(':
+                self.expect('(')
+                power = self.rational()
+                self.expect(')')
+            else:
+                power = self.rational()
+            scale, dims = scale**power, dims**power
+        return scale, dims
+
+    def rational(self):
+        sign = 1
+        if self.peek()[0] in ('+','-'):
+            sign = -1 if self.expect(self.peek()[0])[0] == '-' else 1
+        n = int(self.expect('int')[1])
+        # a '/' followed by an integer belongs to the exponent
+        if (self.peek()[0] == '/' and self.k+1<len(self.tokens) and
+            self.tokens[self.k+1][0] == 'int'):
+            self.expect('/')
+            d = self.expect('int')
+            if not int(d[1]):
+                raise self.error(self.dims,d[2],'zero denominator')
+            return float(sign*n)/int(d[1])
+        return sign*n
+
+def parse_units(dims):
+    """
+    parses a unit string and returns (scale, dims) where scale converts
+    to canonical units and dims is a Dimension
+
+    >>> scale, dims = parse_units('kilometer/hour')
+    >>> print('%.6f %s' % (scale, dims))
+    0.277778 meter*second^-1
+    >>> print(parse_units('(meter/second)^1/2')[1])
+    meter^1/2*second^-1/2
+    >>> parse_units('meter*(second')
+    Traceback (most recent call last):
+    ...
+    SyntaxError: Invalid Dims: unexpected end of string at position 13 in 'meter*(second'
+    >>> parse_units('__import__')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Unknown units '__import__' at position 0 in '__import__'
+    """
+    return UnitParser(dims).parse()
+
+class UnitCache(object):
+    """
+    thread-safe, size-bounded LRU cache of parsed unit strings.
+    maps a unit string (and its normalized form) to (scale, dims)
+
+    >>> cache = UnitCache(maxsize = 2)
+    >>> scale, dims = cache.lookup('meter / second')
+    >>> scale, dims = cache.lookup('meter/second')
+    >>> scale, dims = cache.lookup('meter / second')
+    >>> scale, dims = cache.lookup('hour')
+    >>> sorted(cache.stats().items())
+    [('evictions', 1), ('hits', 2), ('maxsize', 2), ('misses', 2), ('size', 2)]
+    >>> cache.clear()
+    >>> cache.stats()['size']
+    0
+
+    a space separates names, so 'kilo meter' is not 'kilometer',
+    whatever is already in the cache
+
+    >>> cache.lookup('kilo meter')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Unknown units 'kilo' at position 0 in 'kilo meter'
+    >>> scale, dims = cache.lookup('kilometer')
+    >>> cache.lookup('kilo meter')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Unknown units 'kilo' at position 0 in 'kilo meter'
+    """
+    def __init__(self,maxsize = 1024):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.data = OrderedDict()
+            self.hits = self.misses = self.evictions = 0
+
+    def resize(self,maxsize):
+        with self.lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            return dict(hits = self.hits, misses = self.misses,
+                        evictions = self.evictions,
+                        size = len(self.data), maxsize = self.maxsize)
+
+    def _get(self,key):
+        # to be called with the lock held; moves key to the most recent end
+        value = self.data.pop(key,None)
+        if value is not None:
+            self.data[key] = value
+        return value
+
+    def _evict(self):
+        while len(self.data)>self.maxsize:
+            self.data.popitem(last = False)
+            self.evictions += 1
+
+    def lookup(self,dims):
+        with self.lock:
+            value = self._get(dims)
+        if value is None:
+            # strings with the same tokens parse the same, so they share
+            # an entry. spaces separate tokens and are kept between them
+            normalized = ' '.join(t[1] for t in tokenize_units(dims))
+        with self.lock:
+            if value is None:
+                value = self._get(normalized)
+                if value is not None:
+                    self.data[dims] = value
+                    self._evict()
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        # parse outside of the lock, errors are not cached
+        value = parse_units(dims)
+        with self.lock:
+            self.data[normalized] = value
+            self.data[dims] = value
+            self._evict()
+        return value
+
+unit_cache = UnitCache()
+
+# named quantities, in the order in which guess() tries them
+QUANTITIES = [
+    ('length', (1,0,0,0,0,0)),
+    ('area', (2,0,0,0,0,0)),
+    ('volume', (3,0,0,0,0,0)),
+    ('time', (0,1,0,0,0,0)),
+    ('mass', (0,0,1,0,0,0)),
+    ('current', (0,0,0,1,0,0)),
+    ('temperature', (0,0,0,0,1,0)),
+    ('currency', (0,0,0,0,0,1)),
+    ('speed', (1,-1,0,0,0,0)),
+    ('acceleration', (1,-2,0,0,0,0)),
+    ('frequency', (0,-1,0,0,0,0)),
+    ('force', (1,-2,1,0,0,0)),
+    ('pressure', (-1,-2,1,0,0,0)),
+    ('energy', (2,-2,1,0,0,0)),
+    ('power', (2,-3,1,0,0,0)),
+    ('charge', (0,1,0,1,0,0)),
+    ('voltage', (2,-3,1,-1,0,0)),
+    ('resistance', (2,-3,1,-2,0,0)),
+    ('conductance', (-2,3,-1,2,0,0)),
+    ('capacitance', (-2,4,-1,2,0,0)),
+    ('magnetic_flux', (2,-2,1,-2,0,0)),
+    ]
+
+# units tried by auto_convert, most readable first. quantities not listed
+# here use the UNITS with the same dims
+DISPLAY_UNITS = {
+    'length': ['meter','au','lightyear'],
+    'area': ['meter^2'],
+    'volume': ['liter','meter^3'],
+    'time': ['second','minute','hour','day','year'],
+    'mass': ['gram'],
+    'currency': ['dollar'],
+    'speed': ['meter/second','meter/hour'],
+    'acceleration': ['meter/second^2'],
+    'frequency': ['hz'],
+    'force': ['newton'],
+    'pressure': ['pascal','bar','atm'],
+    'energy': ['joule','watt*hour','eV'],
+    'power': ['watt'],
+    }
+
+# exponent -> prefix, for the prefixes that are powers of 1000
+ENGINEERING_PREFIXES = dict((int(round(math.log10(conversion))),name)
+                            for name,conversion in PREFIXES
+                            if int(round(math.log10(conversion)))%3 == 0)
+
+class QuantityIndex(object):
+    """
+    maps each Dimension to its named quantity and to the units that
+    auto_convert may use for it. built on first use
+    """
+    def __init__(self):
+        self.quantities = OrderedDict(
+            (Dimension(dims),name) for name,dims in QUANTITIES)
+        self.units = {}
+
+    def candidates(self,dims):
+        """
+        returns [(units, scale, prefixable)] for dims, most readable first
+        """
+        value = self.units.get(dims)
+        if value is None:
+            quantity = self.quantities.get(dims)
+            names = DISPLAY_UNITS.get(quantity)
+            if names is None:
+                names = sorted(key for key in UNITS if len(key)>1 and
+                               not key in UNPREFIXED and lookup_unit(key)[1] is dims)
+            value = []
+            for name in names:
+                scale, d = unit_cache.lookup(name)
+                if d is dims:
+                    # a prefix can only go on a leading name without exponent
+                    tokens = tokenize_units(name)
+                    prefixable = (not tokens[0][1] in UNPREFIXED and
+                                  (len(tokens) == 1 or tokens[1][0] != '^'))
+                    value.append((name,scale,prefixable))
+            self.units[dims] = value
+        return value
+
+    def guess(self,dims):
+        """
+        returns the name of the quantity, or a product or ratio of two
+        named quantities, or None
+        """
+        name = self.quantities.get(dims)
+        if name is not None:
+            return name
+        for other,other_name in self.quantities.items():
+            name = self.quantities.get(dims/other)
+            if name is not None:
+                return '%s*%s' % (name,other_name)
+            name = self.quantities.get(dims*other)
+            if name is not None:
+                return '%s/%s' % (name,other_name)
+        return None
+
+_quantity_index = []
+
+def quantity_index():
+    if not _quantity_index:
+        _quantity_index.append(QuantityIndex())
+    return _quantity_index[0]
+
+def auto_convert(number):
+    """
+    returns (value, units) expressing number in the most readable of the
+    units for its dims, with an engineering prefix if needed so that the
+    value is between 1 and 1000. prefixes are only used if no unit gives
+    a value in range as it is, and units listed earlier in DISPLAY_UNITS
+    are preferred over later ones
+
+    >>> value, units = auto_convert(Number(3.6e6,0,'joule'))
+    >>> print('%s %s' % (value.value, units))
+    3.6 megajoule
+    >>> value, units = auto_convert(Number(1.602176487e-19,0,'joule'))
+    >>> print('%.6f %s' % (value.value, units))
+    1.000000 eV
+    >>> value, units = auto_convert(Number(2,0,'day'))
+    >>> print('%s %s' % (value.value, units))
+    48.0 hour
+    """
+    candidates = quantity_index().candidates(number.dims)
+    if not candidates:
+        return number.purify(force = True), number.dims.units()
+    v = abs(number.value)
+    # if no unit gives a value in range, the first one is used as it is
+    best, units, n = None, candidates[0][0], candidates[0][1]
+    for rank,(name,scale,prefixable) in enumerate(candidates):
+        x = v/scale
+        if 1<=x<1000 or not x:
+            cost = rank
+        elif prefixable:
+            e = int(math.floor(math.log10(x)/3))*3
+            prefix = ENGINEERING_PREFIXES.get(e)
+            if prefix is None:
+                continue
+            cost, name, scale = rank+len(candidates), prefix+name, scale*10.0**e
+        else:
+            continue
+        if best is None or cost<best:
+            best, units, n = cost, name, scale
+    return Number._new(number.value/n,number.error/n,PURE), units
+
+class _NumberSlots(object):
+    """
+    the layout of Number without its __setattr__. Number._new fills one
+    with plain attribute stores, then turns it into a Number, which is
+    cheaper than setting the slots of a Number through their descriptors
+    """
+    __slots__ = ('value','error','dims')
+
+class Number(object):
     """
     Example of dimensional analysis and conversions
 
@@ -205,8 +834,8 @@ class Number:
     >>> print(c.convert('kilometer/hour'))
     (36.109728 ± 0)
 
-    >>> Number(1,dims = 'joule').convert('eV').value
-    6.2415096471204178e+18
+    >>> print('%.10e' % Number(1,dims = 'joule').convert('eV').value)
+    6.2415096471e+18
 
     >>> print("%s %s %s" % (c.value, c.error, c.units()))
     10.03048 0.0 meter*second^-1
@@ -255,7 +884,7 @@ class Number:
     (1.903 ± 0.538)/10^11
     >>> print(c.convert('kilometer').value)
     180.0
-    >>> print(c.convert('kilometer').error)
+    >>> print('%.10f' % c.convert('kilometer').error)
     50.9116882454
 
     Examples of more complex formulas
@@ -285,34 +914,78 @@ class Number:
     (7.3048 \\pm 0.0365)\\times 10^{4}
 
     """
-    regex = re.compile('([a-zA-Z]+)(\^\-?\d+(/\d+)?)?(\*([a-zA-Z]+)(\^\-?\d+(/\d+)?)?)*(\/([a-zA-Z]+)(\^\-?\d+(/\d+)?)?)*')
-    c_n = dict((key,value[0]) for key,value in UNITS.items())
-    c_l = dict((key,value[1]) for key,value in UNITS.items())
-    c_t = dict((key,value[2]) for key,value in UNITS.items())
-    c_m = dict((key,value[3]) for key,value in UNITS.items())
-    c_a = dict((key,value[4]) for key,value in UNITS.items())
-    c_k = dict((key,value[5]) for key,value in UNITS.items())
-    c_d = dict((key,value[6]) for key,value in UNITS.items())
+    __slots__ = ('value','error','dims')
 
     def __init__(self,value,error = 0.0,dims = 'N'):
         if not isinstance(error,(int,float)):
             raise RuntimeError("second argument must be the error")
-        if isinstance(dims,tuple):
-            dims = 'N*L^%s*T^%s*M^%s*A^%s*K^%s*D^%s' % dims
-        dims = dims.replace(' ','')
-        if not self.regex.match(dims):
-            raise SyntaxError('Invalid Dims')
-        n = eval(dims.replace('^','**'),self.c_n) or 1        
-        l = buckingham(dims,self.c_l)
-        t = buckingham(dims,self.c_t)
-        m = buckingham(dims,self.c_m)
-        a = buckingham(dims,self.c_a)
-        k = buckingham(dims,self.c_k)
-        d = buckingham(dims,self.c_d)
-        self.value = float(value) * n
-        self.error = float(error) * n
-        self.dims = (l,t,m,a,k,d)
+        if isinstance(dims,(Dimension,tuple)):
+            n, dims = 1.0, Dimension(dims)
+        else:
+            n, dims = unit_cache.lookup(dims)
+        _set_value(self,float(value) * n)
+        _set_error(self,float(error) * n)
+        _set_dims(self,dims)
+
+    @classmethod
+    def _new(cls,value,error,dims):
+        """
+        builds a Number from a value and error already in canonical units
+        and a Dimension, skipping the parsing of the units. subclasses
+        that add slots must define their own _new
+
+        >>> Number._new(2.0,1.0,Number(1,dims='meter').dims).units()
+        'meter'
+        """
+        self = _new_object(_NumberSlots)
+        self.value = value
+        self.error = error
+        self.dims = dims
+        self.__class__ = cls
+        return self
+
+    def __setattr__(self,name,value):
+        raise AttributeError("Number is immutable")
+
+    def __delattr__(self,name):
+        raise AttributeError("Number is immutable")
+
+    def __getstate__(self):
+        """
+        >>> import pickle
+        >>> n = Number(1,0.1,'meter')
+        >>> all(pickle.loads(pickle.dumps(n,protocol)) == n
+        ...     for protocol in range(pickle.HIGHEST_PROTOCOL+1))
+        True
+        """
+        return (None,{'value':self.value,'error':self.error,'dims':self.dims})
+
+    def __setstate__(self,state):
+        # unpickling and copy set the slots one by one
+        for name, value in state[1].items():
+            object.__setattr__(self,name,value)
 
+    def __eq__(self,other):
+        """
+        Numbers are immutable and equal if value, error and dims are
+        equal, so they can be used as keys of dicts and in sets
+
+        >>> Number(1,0.1,'kilometer') == Number(1000,100,'meter')
+        True
+        >>> len(set([Number(1,dims='meter'),Number(1,dims='meter')]))
+        1
+        """
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.value == other.value and self.error == other.error \
+            and self.dims is other.dims
+
+    def __ne__(self,other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash((self.value,self.error,self.dims))
 
     def __add__(self,other):
         """
@@ -321,18 +994,25 @@ class Number:
         >>> print(a+b)
         5.00 ± 2.24
         """
-        if not isinstance(other,Number):
-            other=Number(other,0,self.dims)
-        elif self.dims != other.dims:
-            raise RuntimeError("Incompatible Dimensions")
+        if isinstance(other,Number):
+            if self.dims is not other.dims:
+                raise RuntimeError("Incompatible Dimensions")
+            b,db = other.value,other.error
+        else:
+            try:
+                b,db = float(other),0.0
+            except TypeError:
+                return NotImplemented
         a,da = self.value,self.error
-        b,db = other.value,other.error
         c = a+b
-        if not self is other:
+        if not da or not db:
+            # an exact operand needs no propagation
+            dc = abs(da or db)
+        elif not self is other:
             dc = math.sqrt(da**2+db**2)
         else:
             dc = 2.*da
-        return Number(c,dc,self.dims)
+        return Number._new(c,dc,self.dims)
 
     def __radd__(self,other):
         return self+other
@@ -344,23 +1024,28 @@ class Number:
         >>> print(a-b)
         -1.00 ± 2.24
         """
-        if not isinstance(other,Number):
-            other=Number(other,0,self.dims)
-        elif self.dims != other.dims:
-            raise RuntimeError("Incompatible Dimentions")
+        if isinstance(other,Number):
+            if self.dims is not other.dims:
+                raise RuntimeError("Incompatible Dimentions")
+            b,db = other.value,other.error
+        else:
+            try:
+                b,db = float(other),0.0
+            except TypeError:
+                return NotImplemented
         a,da = self.value,self.error
-        b,db = other.value,other.error
         c = a-b
-        if not self is other:
+        if not da or not db:
+            dc = abs(da or db)
+        elif not self is other:
             dc = math.sqrt(da**2+db**2)
         else:
             dc = 0
-        return Number(c,dc,self.dims)
+        return Number._new(c,dc,self.dims)
 
     def __rsub__(self,other):
         x = self - other
-        x.value*=-1
-        return x
+        return Number._new(-x.value,x.error,x.dims)
 
     def __mul__(self,other):
         """
@@ -370,17 +1055,26 @@ class Number:
         >>> print(Number(4,2) * Number(7,3))
         (2.80 ± 1.84)x10
         """
-        if not isinstance(other,Number):
-            other = Number(other)
+        if isinstance(other,Number):
+            b,db = other.value,other.error
+            dims = self.dims*other.dims
+        else:
+            try:
+                b,db = float(other),0.0
+            except TypeError:
+                return NotImplemented
+            dims = self.dims
         a,da = self.value,self.error
-        b,db = other.value,other.error
         c = a*b
-        if not self is other:
+        if not db:
+            dc = abs(da*b)
+        elif not da:
+            dc = abs(db*a)
+        elif not self is other:
             dc = math.sqrt((da*b)**2+(db*a)**2)
         else:
             dc = 2.0*da*a
-        dims = tuple(self.dims[i]+other.dims[i] for i in range(6))
-        return Number(c,dc,dims)
+        return Number._new(c,dc,dims)
 
     def __rmul__(self,other):
         """
@@ -397,209 +1091,754 @@ class Number:
         >>> print(Number(4,2) / Number(7,3))
         (5.71 ± 3.76)/10
         """
-        if not isinstance(other,Number):
-            other = Number(other)
+        if isinstance(other,Number):
+            b,db = other.value,other.error
+            dims = self.dims/other.dims
+        else:
+            try:
+                b,db = float(other),0.0
+            except TypeError:
+                return NotImplemented
+            dims = self.dims
         a,da = self.value,self.error
-        b,db = other.value,other.error
         c = a/b
-        if not self is other:
-            dc = math.sqrt((da/b)**2+((a*db)/(b*b))**2)
-        else:
+        if not db:
+            dc = abs(da/b)
+        elif self is other:
             dc = 0.0
-        dims = tuple(self.dims[i]-other.dims[i] for i in range(6))
-        return Number(c,dc,dims)
+        elif not da:
+            dc = abs((a*db)/(b*b))
+        else:
+            dc = math.sqrt((da/b)**2+((a*db)/(b*b))**2)
+        return Number._new(c,dc,dims)
 
     def __rdiv__(self,other):
         """
         >>> print(1 / Number(2,1))
         (5.00 ± 2.50)/10
         """
-        if not isinstance(other,Number):
-            other = Number(other)
-        return other/self
+        if isinstance(other,Number):
+            return other/self
+        try:
+            b = float(other)
+        except TypeError:
+            return NotImplemented
+        a,da = self.value,self.error
+        dc = abs((b*da)/(a*a)) if da else 0.0
+        return Number._new(b/a,dc,PURE/self.dims)
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
 
     def __pow__(self,other):
-        if not isinstance(other,Number):
-            other = Number(other)
-        elif not other.is_pure():
-            raise RuntimeError("Incompatible Dimentions")
+        """
+        >>> (Number(4,dims = 'meter^2')**0.5).units()
+        'meter'
+
+        exact quantities skip the propagation of errors, which takes
+        log(a) when the exponent is a Number
+
+        >>> print(Number(-2,dims = 'meter')**Number(2))
+        (4.000000 ± 0)
+        """
+        if isinstance(other,Number):
+            if not other.is_pure():
+                raise RuntimeError("Incompatible Dimentions")
+            b,db = other.value,other.error
+        else:
+            try:
+                b,db = float(other),0.0
+            except TypeError:
+                return NotImplemented
         a,da = self.value,self.error
-        b,db = other.value,other.error
-        dims = tuple(self.dims[i]*other.value for i in range(6))
+        dims = self.dims**b
         c = a**b
-        if not self is other:
-            dc = abs(c)*math.sqrt((da*b/a)**2+(db*math.log(a))**2)
-        else:
+        if not da and not db:
+            # exact, so log(a) is not needed (nor defined for a <= 0)
+            dc = 0.0
+        elif self is other:
             dc = abs(c)*(da*abs(b/a)+db*math.log(a))
-        return Number(c,dc,dims)
+        elif not db:
+            dc = abs(c)*abs(da*b/a)
+        else:
+            dc = abs(c)*math.sqrt((da*b/a)**2+(db*math.log(a))**2)
+        return Number._new(c,dc,dims)
+
+    def _apply(self,value,derivative):
+        """
+        result of a function of one variable, given its value and its
+        derivative at self.value
+        """
+        return Number._new(value,abs(derivative)*self.error,self.dims)
 
     def convert(self,dims):
         """
         >>> print(Number(0, dims="meter/second").convert('kilometer/hour'))
         (0.000000 ± 0)
         """
-        other = Number(1.0,0,dims)
-        if self.dims != other.dims:
+        n, dims = unit_cache.lookup(dims)
+        if self.dims is not dims:
             raise RuntimeError("Incompatible Dimensions")
-        return self/other
+        return Number._new(self.value/n,self.error/n,PURE)
 
     def as_string(self,decimals = 2):
-        value,error,dims = self.value,self.error,self.dims
-        if error:
-            n = int_safe(abs(value))
-            m = int_safe(error)
-            value = value/(10**n)
-            error = error/(10**n)
-            i = str(max(n-m+2,decimals))
-        else:
-            return ("(%f ± 0)") % (value)
-        if n>1:
-            a = ("(%."+i+"f ± %."+i+"f)x10^%i") % (value,error,n)
-        elif n>0:
-            a = ("(%."+i+"f ± %."+i+"f)x10") % (value,error)
-        elif n<-1:
-            a = ("(%."+i+"f ± %."+i+"f)/10^%i") % (value,error,-n)
-        elif n<0:
-            a = ("(%."+i+"f ± %."+i+"f)/10") % (value,error)
-        else:
-            a = ("%."+i+"f ± %."+i+"f") % (value,error)
-        return a
+        return format_number(self.value,self.error,'plain',decimals)
 
     def as_latex(self,decimals = 2):
-        value,error,dims = self.value,self.error,self.dims
-        if error:
-            n = int_safe(abs(value))
-            m = int_safe(error)
-            value = value/(10**n)
-            error = error/(10**n)
-            i = str(max(n-m+2,decimals))
-        else:
-            return ("(%f \\pm 0)") % (value)
-        if n>1:
-            a = ("(%."+i+"f \\pm %."+i+"f)\\times 10^{%i}") % (value,error,n)
-        elif n>0:
-            a = ("(%."+i+"f \\pm %."+i+"f)\\times 10") % (value,error)
-        elif n<-1:
-            a = ("(%."+i+"f \\pm %."+i+"f)\\times 10^{%i}") % (value,error,-n)
-        elif n<0:
-            a = ("(%."+i+"f \\pm %."+i+"f)\\times 10^{-1}") % (value,error,-n)
-        else:
-            a = ("%."+i+"f \\pm %."+i+"f") % (value,error)
-        return a
+        return format_number(self.value,self.error,'latex',decimals)
 
     def __str__(self):
         return self.as_string()
 
     def is_pure(self):
-        return sum(x*x for x in self.dims) == 0
+        return self.dims is PURE
 
     def purify(self,force = False):
         if not force and not self.is_pure():
             raise RuntimeError("Try purify(force = True)")
-        return Number(self.value,self.error,(0,0,0,0,0))
+        return Number._new(self.value,self.error,PURE)
 
     def units(self):
-        if self.is_pure():
-            return 'none'
-        def f(a,n):
-            if float(n) == 0:
-                return ''
-            if float(n) == 1:
-                return '*%s' % a
-            if float(n)>0:
-                return '*%s^%s'%(a,n)
-            if float(n)<0:
-                return '*%s^%s' %(a,n)
-        r = ''
-        r+=f('meter',self.dims[0])
-        r+=f('second',self.dims[1])
-        r+=f('gram',self.dims[2])
-        r+=f('ampere',self.dims[3])
-        r+=f('kelvin',self.dims[4])
-        r+=f('currency',self.dims[5])
-        return r[1:]
+        return self.dims.units()
 
 
     def guess(self):
-        raise RuntimeError("this function is a work in progress...")
+        """
+        names the quantity, from an index of dims to quantities
+
+        >>> Number(1,dims = 'kilowatt*hour').guess()
+        'energy'
+        >>> Number(1,dims = 'dollar/day').guess()
+        'currency/time'
+        """
         if self.is_pure():
             return 'pure'
-        options={
-            'length': (1,0,0,0,0,0),
-            'area': (2,0,0,0,0,0),
-            'volume': (3,0,0,0,0,0),
-            'speed': (1,-1,0,0,0,0),
-            'time': (0,1,0,0,0,0),
-            'mass': (0,0,1,0,0,0),
-            'current': (0,0,0,1,0,0),
-            'charge': (0,0,1,1,0,0),
-            'temperature': (0,0,0,0,1,0),
-            'currency': (0,0,0,0,0,1),
-            'pressure': (-1,-2,1,0,0,0),
-            'energy':(2,-2,1,0,0,0),
-            'frequency':(0,-1,0,0,0,0),
-            'resistance':(2,-3,1,-2,0,0),
-            'acceptance':(-2,4,-1,2,0,0),
-            'conductance':(-2,3,-1,2,0,0),
-            'voltage':(2,-3,1,-1,0,0),
-            'power':(1,-3,1,0,0,0),
-            'magnetic_flux':(2,-2,1,-2,0,0)}
-        dims=self.dims
-        r=''
-        while True:            
-            n=1
-            #### fix this... compute n
-            y = [i/n for i in dims]
-            if not sum(y): break
-            def d1(u,w):
-                return sum((u[i]-float(j))*(u[i]-float(j)) for i,j in enumerate(w))
-            def d2(u,w):
-                return sum((u[i]+float(j))*(u[i]+float(j)) for i,j in enumerate(w))
-            matches = [(d1(x,y),key,+1) for key,x in options.items()]
-            matches += [(d2(x,y),key,-1) for key,x in options.items()]
-            matches.sort()
-            key,sign=matches[0][1],matches[0][2]
-            r += '*%s' % key
-            if n*sign!=1: r+='^%s' % (n*sign)
-            if matches[0]==0: break
-            dims = [(y[i]-j*sign) for i,j in enumerate(options[key])]
-        return r[1:]
+        return quantity_index().guess(self.dims) or self.dims.units()
+
+    def auto_convert(self):
+        """
+        >>> value, units = Number(1500,0.2,'meter').auto_convert()
+        >>> print('%s %s' % (value, units))
+        1.500000 ± 0.000200 kilometer
+        """
+        return auto_convert(self)
+
+    @staticmethod
+    def fsum(numbers):
+        """ sum of independent Numbers, see buckingham.fsum """
+        return fsum(numbers)
+
+# the slots of Number, set directly since Number.__setattr__ refuses
+_new_object = object.__new__
+_set_value = Number.value.__set__
+_set_error = Number.error.__set__
+_set_dims = Number.dims.__set__
 
 def sin(x):
     if not isinstance(x,Number):
+        if hasattr(x,'sin'):
+            return x.sin()
         return math.sin(x)
     if not x.is_pure():
         raise RuntimeError("Incompatible Dimensions")
-    return Number(sin(x.value),abs(cos(x.value))*x.error,x.dims)
+    return x._apply(sin(x.value),cos(x.value))
 
 def cos(x):
     if not isinstance(x,Number):
+        if hasattr(x,'cos'):
+            return x.cos()
         return math.cos(x)
     if not x.is_pure():
         raise RuntimeError("Incompatible Dimensions")
-    return Number(cos(x.value),abs(sin(x.value))*x.error,x.dims)
+    return x._apply(cos(x.value),-sin(x.value))
 
 def exp(x):
     if not isinstance(x,Number):
+        if hasattr(x,'exp'):
+            return x.exp()
         return math.exp(x)
     if not x.is_pure():
         raise RuntimeError("Incompatible Dimensions")
     c = exp(x.value)
-    return Number(c,abs(c)*x.error,x.dims)
+    return x._apply(c,c)
 
 def log(x):
     if not isinstance(x,Number):
+        if hasattr(x,'log'):
+            return x.log()
         return math.log(x)
     if not x.is_pure():
         raise RuntimeError("Incompatible Dimensions")
     c = log(x.value)
-    return Number(c,abs(x.error/x.value),x.dims)
+    return x._apply(c,1.0/x.value)
+
+class UnitConstants(object):
+    """
+    the Number 1 of every unit (meter, kilometer, ...), built on first
+    access and then shared, which is safe since Numbers are immutable
+
+    >>> unit_constants.meter is unit_constants['meter']
+    True
+    >>> print((5*unit_constants.meter/unit_constants.second).units())
+    meter*second^-1
+    """
+    def __init__(self):
+        self._numbers = {}
+
+    def __getitem__(self,name):
+        number = self._numbers.get(name)
+        if number is None:
+            if lookup_unit(name) is None:
+                raise KeyError(name)
+            number = self._numbers[name] = Number(1,0,name)
+        return number
+
+    def __getattr__(self,name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self,name):
+        return lookup_unit(name) is not None
+
+    def keys(self):
+        return unit_names()
+
+    __iter__ = keys
+
+    def __dir__(self):
+        return list(unit_names())
+
+unit_constants = UnitConstants()
 
 def allunits():
-    return dict((key,Number(1,0,key)) for key in UNITS.keys())
+    """ {name: unit_constants[name]} for every unit name """
+    return dict((key,unit_constants[key]) for key in unit_names())
+
+def memoize(maxsize = 1024):
+    """
+    decorator that caches the results of a pure function of Numbers,
+    unit strings and other hashable arguments, such as the repeated
+    conversions of a config-driven model. Numbers of different classes
+    are cached separately
+
+    >>> @memoize()
+    ... def speed_limit(x):
+    ...     return x.convert('kilometer/hour')
+    >>> limit = speed_limit(55*unit_constants.mile/unit_constants.hour)
+    >>> limit is speed_limit(Number(55,dims='mile/hour'))
+    True
+    >>> speed_limit.cache_info().hits
+    1
+    """
+    import functools
+    lru_cache = getattr(functools,'lru_cache',None) or _lru_cache
+    return lru_cache(maxsize = maxsize,typed = True)
+
+_CacheInfo = namedtuple('CacheInfo','hits misses maxsize currsize')
+
+def _lru_cache(maxsize = 128,typed = False):
+    """
+    functools.lru_cache for Pythons that lack it (2.7)
+
+    >>> @_lru_cache(maxsize = 2,typed = True)
+    ... def double(x):
+    ...     return 2*x
+    >>> double(1), double(1.0), double(1), double(2), double(3), double(1)
+    (2, 2.0, 2, 4, 6, 2)
+    >>> double.cache_info()
+    CacheInfo(hits=1, misses=5, maxsize=2, currsize=2)
+    """
+    import functools
+    separator = object()
+    def decorator(function):
+        cache, stats, lock = OrderedDict(), [0,0], threading.Lock()
+        def wrapper(*args,**kwargs):
+            key = args
+            if kwargs:
+                key += (separator,)+tuple(sorted(kwargs.items()))
+            if typed:
+                key += tuple(type(x) for x in args)
+                key += tuple(type(kwargs[k]) for k in sorted(kwargs))
+            with lock:
+                if key in cache:
+                    # most recently used last
+                    value = cache[key] = cache.pop(key)
+                    stats[0] += 1
+                    return value
+                stats[1] += 1
+            value = function(*args,**kwargs)
+            with lock:
+                cache[key] = value
+                if maxsize is not None and len(cache)>maxsize:
+                    cache.popitem(last = False)
+            return value
+        wrapper.cache_info = lambda: _CacheInfo(stats[0],stats[1],maxsize,
+                                                len(cache))
+        def cache_clear():
+            with lock:
+                cache.clear()
+                stats[:] = [0,0]
+        wrapper.cache_clear = cache_clear
+        return functools.wraps(function)(wrapper)
+    return decorator
 
 def pm(error):
-    return Number(0,error)
+    if not isinstance(error,(int,float)):
+        raise RuntimeError("second argument must be the error")
+    return Number._new(0.0,float(error),PURE)
+
+class Converter(object):
+    """
+    callable that rescales values from one unit to another with a
+    precomputed factor. built by converter(), see there
+    """
+    def __init__(self,factor,dims,scale):
+        self.factor = factor
+        self.dims = dims
+        # scale of the target units, used for Numbers (in canonical units)
+        self.scale = scale
+
+    def __call__(self,value,error = None):
+        factor = self.factor
+        if isinstance(value,float):
+            value = value*factor
+        elif isinstance(value,Number):
+            if value.dims is not self.dims:
+                raise RuntimeError("Incompatible Dimensions")
+            return Number._new(value.value/self.scale,value.error/self.scale,PURE)
+        elif isinstance(value,(list,tuple)):
+            value = [x*factor for x in value]
+        elif hasattr(value,'typecode'):
+            # array.array, detected by duck typing so that the stdlib array
+            # module is not confused with buckingham.array. the result is
+            # an array of doubles whatever the typecode of value
+            value = value.__class__('d',[x*factor for x in value])
+        else:
+            # int and numpy arrays
+            value = value*factor
+        if error is None:
+            return value
+        return value, self(error)
+
+    def __repr__(self):
+        return '<Converter %s x %r>' % (self.dims,self.factor)
+
+def converter(source,target):
+    """
+    checks once that source and target are compatible and returns a
+    callable that multiplies by the conversion factor. source can be a
+    unit string, a Dimension or a Number (whose values are in canonical
+    units). the callable accepts scalars, sequences, array.array (the
+    result is always an array of doubles) and numpy arrays, and an
+    optional error argument
+
+    >>> f = converter('mile/hour','kilometer/hour')
+    >>> print(round(f(60.0),6))
+    96.56064
+    >>> [round(x,3) for x in f([1.0, 2.0])]
+    [1.609, 3.219]
+    >>> value, error = f(60.0, 1.0)
+    >>> print(round(error,6))
+    1.609344
+    >>> from array import array
+    >>> converter('kilometer','meter')(array('i',[1,2]))
+    array('d', [1000.0, 2000.0])
+    >>> g = converter(Number(1,dims='meter/second'),'kilometer/hour')
+    >>> print(g(Number(10,dims='meter/second')))
+    (36.000000 ± 0)
+    >>> converter('mile','hour')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Incompatible Dimensions
+    """
+    if isinstance(source,Number):
+        source_scale, source_dims = 1.0, source.dims
+    elif isinstance(source,(Dimension,tuple)):
+        source_scale, source_dims = 1.0, Dimension(source)
+    else:
+        source_scale, source_dims = unit_cache.lookup(source)
+    target_scale, target_dims = unit_cache.lookup(target)
+    if source_dims is not target_dims:
+        raise RuntimeError("Incompatible Dimensions")
+    return Converter(float(source_scale)/target_scale,target_dims,target_scale)
+
+_VALUE = operator.attrgetter('value')
+_ERROR = operator.attrgetter('error')
+_DIMS = operator.attrgetter('dims')
+
+class Accumulator(object):
+    """
+    running sum of independent Numbers with the same dims. values are
+    added with compensated summation and errors as a sum of squares, so
+    no Number is built and no sqrt is taken until number()
+
+    >>> total = Accumulator()
+    >>> total += Number(2,1,'dollar')
+    >>> total -= Number(3,2,'dollar')
+    >>> print('%s %s' % (total.number(), total.number().units()))
+    -1.00 ± 2.24 currency
+    >>> total += Number(1,dims='meter')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Incompatible Dimensions
+    """
+    __slots__ = ('dims','total','compensation','variance','count')
+    CHUNK = 4096
+
+    def __init__(self,dims = None):
+        if dims is not None and not isinstance(dims,Dimension):
+            dims = Dimension(dims) if isinstance(dims,tuple) \
+                else unit_cache.lookup(dims)[1]
+        self.dims = dims
+        self.total = 0.0
+        self.compensation = 0.0
+        self.variance = 0.0
+        self.count = 0
+
+    def __getstate__(self):
+        """
+        >>> import pickle
+        >>> total = Accumulator()
+        >>> total += Number(2,1,'dollar')
+        >>> print(pickle.loads(pickle.dumps(total,0)).number())
+        2.00 ± 1.00
+        """
+        return (None,dict((name,getattr(self,name)) for name in self.__slots__))
+
+    def extend(self,numbers,sign = 1.0):
+        """
+        adds (or with sign = -1 subtracts) every item of an iterable of
+        Numbers and plain numbers. plain numbers are exact and take the
+        dims of the Numbers, as in a+b. items are read in chunks, each
+        summed exactly by math.fsum
+        """
+        numbers = iter(numbers)
+        while True:
+            chunk = list(itertools.islice(numbers,self.CHUNK))
+            if not chunk:
+                return self
+            try:
+                values = list(map(_VALUE,chunk))
+                errors = list(map(_ERROR,chunk))
+                dims = set(map(_DIMS,chunk))
+            except AttributeError:
+                # plain numbers in the chunk
+                values, errors, dims = [], [], set()
+                for x in chunk:
+                    if isinstance(x,Number):
+                        values.append(x.value)
+                        errors.append(x.error)
+                        dims.add(x.dims)
+                    else:
+                        values.append(float(x))
+            if self.dims is not None:
+                dims.add(self.dims)
+            if len(dims) > 1:
+                raise RuntimeError("Incompatible Dimensions")
+            if dims:
+                self.dims = dims.pop()
+            self._add(sign*math.fsum(values))
+            self.variance += sum(map(operator.mul,errors,errors))
+            self.count += len(chunk)
+
+    def _add(self,x):
+        # Neumaier's compensated summation
+        s = self.total
+        t = s+x
+        if abs(s) >= abs(x):
+            self.compensation += (s-t)+x
+        else:
+            self.compensation += (x-t)+s
+        self.total = t
+
+    def add(self,number,sign = 1.0):
+        """ adds one Number or plain number """
+        if isinstance(number,Number):
+            if number.dims is not self.dims:
+                if self.dims is not None:
+                    raise RuntimeError("Incompatible Dimensions")
+                self.dims = number.dims
+            error = number.error
+            self.variance += error*error
+            self._add(sign*number.value)
+        else:
+            self._add(sign*float(number))
+        self.count += 1
+        return self
+
+    def subtract(self,number):
+        return self.add(number,-1.0)
+
+    __iadd__ = add
+
+    def __isub__(self,number):
+        return self.add(number,-1.0)
+
+    def __len__(self):
+        return self.count
+
+    def number(self):
+        """ the sum as a Number """
+        return Number._new(self.total+self.compensation,math.sqrt(self.variance),
+                           PURE if self.dims is None else self.dims)
+
+def fsum(numbers):
+    """
+    sums an iterable of independent Numbers with the same dims, as
+    sum() would but checking each dims by identity, without building
+    intermediate Numbers and with compensated summation of the values
+
+    >>> print(fsum([Number(2,1),Number(3,2)]))
+    5.00 ± 2.24
+    >>> x = fsum([Number(1e16,dims='dollar'),Number(1,dims='dollar'),
+    ...           Number(-1e16,dims='dollar')])
+    >>> print('%s %s' % (x.value, x.units()))
+    1.0 currency
+
+    sequences of Numbers that track correlations (subclasses of Number
+    such as Correlated) are added with their own operators
+    """
+    numbers = iter(numbers)
+    for first in numbers:
+        if type(first) is not Number and isinstance(first,Number):
+            for x in numbers:
+                first = first+x
+            return first
+        return Accumulator().extend(itertools.chain((first,),numbers)).number()
+    return Number._new(0.0,0.0,PURE)
+
+class RunningMeasurement(object):
+    """
+    inverse-variance weighted mean of repeated measurements of the same
+    quantity, updated one measurement at a time in constant memory.
+    measurements are Numbers or (value, error, units) tuples in any
+    units with the dims of the first one
+
+    >>> m = RunningMeasurement()
+    >>> m += Number(14.7,0.2,'psi')
+    >>> m += (1.0,0.01,'bar')
+    >>> m += (750,5,'mmhg')
+    >>> print(m.number().convert('bar'))
+    1.00184 ± 0.00515
+    >>> len(m), round(m.chi2,3)
+    (3, 0.836)
+
+    partial accumulators (from other processes or shards) are combined
+    with merge(), with the same result as adding all the measurements
+    to one of them
+
+    >>> a, b = RunningMeasurement(), RunningMeasurement()
+    >>> _ = a.extend([Number(14.7,0.2,'psi'),(1.0,0.01,'bar')])
+    >>> _ = b.add((750,5,'mmhg'))
+    >>> print(a.merge(b).number().convert('bar'))
+    1.00184 ± 0.00515
+    >>> m += Number(1,0.1,'meter')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Incompatible Dimensions
+    """
+    __slots__ = ('dims','weight','mean','chi2','count')
+
+    def __init__(self,dims = None):
+        if dims is not None and not isinstance(dims,Dimension):
+            dims = Dimension(dims) if isinstance(dims,tuple) \
+                else unit_cache.lookup(dims)[1]
+        self.dims = dims
+        # sum of the weights 1/error^2, weighted mean and sum of the
+        # weighted squared deviations from it (West's algorithm)
+        self.weight = 0.0
+        self.mean = 0.0
+        self.chi2 = 0.0
+        self.count = 0
+
+    def __getstate__(self):
+        """
+        >>> import pickle
+        >>> m = RunningMeasurement()
+        >>> m += Number(14.7,0.2,'psi')
+        >>> print(pickle.loads(pickle.dumps(m,0)).number().convert('psi'))
+        (1.4700 ± 0.0200)x10
+        """
+        return (None,dict((name,getattr(self,name)) for name in self.__slots__))
+
+    def add(self,measurement):
+        """ adds a Number or a (value, error, units) tuple """
+        if isinstance(measurement,Number):
+            value, error, dims = measurement.value, measurement.error, \
+                measurement.dims
+        else:
+            value, error, units = measurement
+            n, dims = unit_cache.lookup(units)
+            value, error = float(value)*n, float(error)*n
+        if dims is not self.dims:
+            if self.dims is not None:
+                raise RuntimeError("Incompatible Dimensions")
+            self.dims = dims
+        if not error:
+            raise RuntimeError("A measurement without error has no weight")
+        w = 1.0/(error*error)
+        self.weight += w
+        delta = value-self.mean
+        self.mean += delta*w/self.weight
+        self.chi2 += w*delta*(value-self.mean)
+        self.count += 1
+        return self
+
+    __iadd__ = add
+
+    def extend(self,measurements):
+        for measurement in measurements:
+            self.add(measurement)
+        return self
+
+    def merge(self,other):
+        """ adds the measurements of another RunningMeasurement, in place """
+        if not other.count:
+            return self
+        if self.dims is not other.dims and self.dims is not None:
+            raise RuntimeError("Incompatible Dimensions")
+        if not self.count:
+            self.dims, self.weight, self.mean, self.chi2, self.count = \
+                other.dims, other.weight, other.mean, other.chi2, other.count
+            return self
+        weight = self.weight+other.weight
+        delta = other.mean-self.mean
+        self.chi2 += other.chi2+delta*delta*self.weight*other.weight/weight
+        self.mean += delta*other.weight/weight
+        self.weight = weight
+        self.count += other.count
+        return self
+
+    def __len__(self):
+        return self.count
+
+    def reduced_chi2(self):
+        """ chi2 per degree of freedom, about 1 for consistent measurements """
+        return self.chi2/(self.count-1) if self.count > 1 else 0.0
+
+    def number(self,scale = False):
+        """
+        the weighted mean as a Number. with scale = True the error is
+        multiplied by sqrt(reduced_chi2()) when that is larger than one,
+        as is customary for inconsistent measurements
+        """
+        if not self.count:
+            raise RuntimeError("No measurements")
+        error = 1.0/math.sqrt(self.weight)
+        if scale:
+            error *= max(1.0,math.sqrt(self.reduced_chi2()))
+        return Number._new(self.mean,error,self.dims)
+
+def compile(func,**input_units):
+    """
+    traces func once on symbolic inputs in the given units, checks its
+    dimensions and returns a kernel over plain floats or numpy arrays.
+    see buckingham.tracing
+
+    >>> kernel = compile(lambda d, t: d/t, d='mile', t='hour')
+    >>> value, error = kernel.convert('mile/hour')((60.0, 1.0), 2.0)
+    >>> print('%s %s' % (value, error))
+    30.0 0.5
+    """
+    from buckingham.tracing import compile_formula
+    return compile_formula(func,**input_units)
+
+def format_numbers(numbers,style = 'plain',decimals = 2,units = None,
+                   out = None,separator = '\n'):
+    """
+    formats many numbers at once, as as_string (style 'plain') or as_latex
+    (style 'latex') would. numbers is an iterable of Numbers or of
+    (value, error) pairs in canonical units, or a NumberArray.
+    if units is True the canonical units of each number are appended; if
+    it is a unit string the numbers are converted to those units first.
+    yields the strings or, if out is a file-like object, writes them to
+    out followed by separator and returns how many were written
+
+    >>> numbers = [Number(1,0.1,'meter'),Number(2000,30,'meter')]
+    >>> list(format_numbers(numbers,units = 'kilometer'))
+    ['(1.000 ± 0.100)/10^3 kilometer', '2.0000 ± 0.0300 kilometer']
+    >>> import io
+    >>> out = io.StringIO()
+    >>> format_numbers(numbers,'latex',units = True,out = out)
+    2
+    >>> print(out.getvalue().splitlines()[1])
+    (2.0000 \\pm 0.0300)\\times 10^{3} meter
+    """
+    lines = _format_numbers(numbers,style,decimals,units)
+    if out is None:
+        return lines
+    count = 0
+    while True:
+        # one write per block of lines
+        block = list(itertools.islice(lines,1000))
+        if not block:
+            return count
+        block.append('')
+        out.write(separator.join(block))
+        count += len(block)-1
+
+def _format_numbers(numbers,style,decimals,units):
+    array_dims = None
+    # there is no NumberArray unless buckingham.array was imported, so
+    # it is looked up there rather than imported (with numpy) here
+    NumberArray = getattr(sys.modules.get('buckingham.array'),'NumberArray',
+                          None)
+    if NumberArray is not None and isinstance(numbers,NumberArray):
+        array_dims = numbers.dims
+        numbers = zip(numbers.values.ravel().tolist(),
+                      numbers.errors.ravel().tolist())
+    exact = STYLES[style]['exact']
+    log10 = math.log10
+    floor = math.floor
+    # (decimals, exponent) -> (template, scale) and dims -> (factor, suffix)
+    templates, suffixes = {}, {}
+    suffix = ''
+    for number in numbers:
+        if isinstance(number,Number):
+            value,error,dims = number.value,number.error,number.dims
+        else:
+            (value,error),dims = number,array_dims
+        if units:
+            factor_suffix = suffixes.get(dims)
+            if factor_suffix is None:
+                if units is True:
+                    factor_suffix = (1.0,' '+(dims or PURE).units())
+                else:
+                    factor_suffix = (1.0/converter(dims or PURE,units).scale,
+                                     ' '+units)
+                suffixes[dims] = factor_suffix
+            factor,suffix = factor_suffix
+            value,error = value*factor,error*factor
+        if not error:
+            yield exact % value+suffix
+            continue
+        # int_safe inlined: floor(log10(x)), 0 for x = 0
+        n = floor(log10(value if value>0 else -value)) if value else 0
+        i = n-floor(log10(error))+2
+        if i<decimals:
+            i = decimals
+        t = templates.get((i,n))
+        if t is None:
+            t = templates[(i,n)] = (template(style,i,n),10**n)
+        yield t[0] % (value/t[1],error/t[1])+suffix
+
+def map_evaluate(formula,records,workers = 0,chunksize = 1000,units = ()):
+    """
+    evaluates formula on each record of (value, error, units) inputs in
+    a pool of worker processes and yields the results in order. see
+    buckingham.parallel
+    """
+    from buckingham.parallel import map_evaluate
+    return map_evaluate(formula,records,workers = workers,
+                        chunksize = chunksize,units = units)
+
+if os.environ.get('BUCKINGHAM_PROFILE'):
+    from buckingham.instrument import _from_environment
+    _from_environment(os.environ['BUCKINGHAM_PROFILE'])
 
 if __name__ == '__main__':
     import doctest
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface
+
+    python -m buckingham test
+    python -m buckingham convert --to kilometer/hour input.csv output.csv
+    python -m buckingham convert --to psi --format jsonl --workers 4 < in > out
+"""
+
+import argparse
+import doctest
+import io
+import sys
+
+import buckingham
+from buckingham.stream import FORMATS, convert_stream
+
+def open_text(filename, mode):
+    if filename == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        return io.open(stream.fileno(), mode, encoding='utf-8', newline='',
+                       closefd=False)
+    return io.open(filename, mode, encoding='utf-8', newline='')
+
+def convert(options):
+    format = options.format
+    if format is None:
+        name = options.output if options.input == '-' else options.input
+        format = 'jsonl' if name.endswith(('.jsonl', '.json')) else 'csv'
+    source = open_text(options.input, 'r')
+    target = open_text(options.output, 'w')
+    try:
+        stats = convert_stream(
+            source, target, options.to, format=format,
+            chunksize=options.chunksize, workers=options.workers,
+            fields=(options.value, options.error, options.unit),
+            default_unit=options.default_unit,
+            skip_invalid=options.skip_invalid, log=sys.stderr)
+    except RuntimeError as e:
+        sys.stderr.write('%s\n' % e)
+        return 1
+    finally:
+        source.close()
+        target.close()
+    if options.verbose:
+        sys.stderr.write('%(rows)i records in %(chunks)i chunks, '
+                         '%(invalid)i invalid\n' % stats)
+    return 0
+
+def test(options):
+    failures = doctest.testmod(buckingham, verbose=options.verbose)[0]
+    return 1 if failures else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m buckingham')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser(
+        'convert', help='convert the value and error columns of a '
+        'CSV or JSON-lines file to other units')
+    command.add_argument('input', nargs='?', default='-',
+                         help='input file (default stdin)')
+    command.add_argument('output', nargs='?', default='-',
+                         help='output file (default stdout)')
+    command.add_argument('--to', required=True, help='target units')
+    command.add_argument('--format', choices=FORMATS,
+                         help='default from the file extension, else csv')
+    command.add_argument('--value', default='value',
+                         help='name of the value column')
+    command.add_argument('--error', default='error',
+                         help='name of the error column (optional in input)')
+    command.add_argument('--unit', default='unit',
+                         help='name of the unit column')
+    command.add_argument('--from', dest='default_unit',
+                         help='units of the records without a unit column')
+    command.add_argument('--chunksize', type=int, default=10000,
+                         help='records per chunk')
+    command.add_argument('--workers', type=int, default=0,
+                         help='size of the process pool (default none)')
+    command.add_argument('--skip-invalid', action='store_true',
+                         help='report invalid records to stderr and drop them')
+    command.add_argument('-v', '--verbose', action='store_true')
+    command.set_defaults(func=convert)
+    command = commands.add_parser('test', help='run the doctests')
+    command.add_argument('-v', '--verbose', action='store_true')
+    command.set_defaults(func=test)
+    options = parser.parse_args(argv)
+    if not options.command:
+        parser.print_help()
+        return 2
+    return options.func(options)
+
+if __name__ == '__main__':
+    sys.exit(main())
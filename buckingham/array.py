@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized Numbers backed by NumPy
+
+A NumberArray holds one Dimension shared by all its elements and two
+contiguous float64 arrays, one for the values and one for the errors
+(in canonical units). Dimensions are checked once per array operation.
+
+    >>> from buckingham import Number
+    >>> x = NumberArray([1, 2, 3], [0.1, 0.1, 0.2], 'kilometer')
+    >>> t = Number(0.5, 0, 'hour')
+    >>> v = (x/t).convert('kilometer/hour')
+    >>> print(v[1])
+    4.000 ± 0.200
+
+    >>> print(x.sum().convert('meter'))
+    (6.000 ± 0.245)x10^3
+
+    >>> x + t
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Incompatible Dimensions
+"""
+
+import numpy
+
+from buckingham import Dimension, Number, PURE, unit_cache
+
+__all__ = ['NumberArray']
+
+class NumberArray(object):
+
+    # makes numpy defer to the reflected operators of NumberArray
+    __array_ufunc__ = None
+
+    def __init__(self, values, errors=0.0, dims='N'):
+        if isinstance(dims, (Dimension, tuple)):
+            n, dims = 1.0, Dimension(dims)
+        else:
+            n, dims = unit_cache.lookup(dims)
+        values = numpy.asarray(values, dtype=numpy.float64)*n
+        errors = numpy.asarray(errors, dtype=numpy.float64)*n
+        self.values = numpy.ascontiguousarray(values)
+        self.errors = numpy.ascontiguousarray(
+            numpy.broadcast_to(errors, values.shape))
+        self.dims = dims
+
+    @classmethod
+    def _new(cls, values, errors, dims):
+        """ builds a NumberArray from arrays already in canonical units """
+        self = cls.__new__(cls)
+        self.values = values
+        self.errors = errors
+        self.dims = dims
+        return self
+
+    @classmethod
+    def from_numbers(cls, numbers):
+        """
+        >>> from buckingham import Number
+        >>> a = NumberArray.from_numbers([Number(1, 0.1, 'meter'),
+        ...                               Number(2, 0.2, 'foot')])
+        >>> print(a[1].convert('foot'))
+        2.000 ± 0.200
+        """
+        numbers = list(numbers)
+        if not numbers:
+            raise RuntimeError("Cannot infer dims of an empty sequence")
+        dims = numbers[0].dims
+        for number in numbers:
+            if number.dims is not dims:
+                raise RuntimeError("Incompatible Dimensions")
+        values = numpy.array([x.value for x in numbers], dtype=numpy.float64)
+        errors = numpy.array([x.error for x in numbers], dtype=numpy.float64)
+        return cls._new(values, errors, dims)
+
+    def to_numbers(self):
+        return [Number._new(float(v), float(e), self.dims)
+                for v, e in zip(self.values.flat, self.errors.flat)]
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        for i in range(len(self.values)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        values, errors = self.values[key], self.errors[key]
+        if numpy.ndim(values) == 0:
+            return Number._new(float(values), float(errors), self.dims)
+        return NumberArray._new(values, errors, self.dims)
+
+    def _operand(self, other, dims):
+        """
+        returns (values, errors, dims) of other; plain numbers and arrays
+        are treated as exact quantities with the given dims
+        """
+        if isinstance(other, (NumberArray, Number)):
+            if isinstance(other, NumberArray):
+                return other.values, other.errors, other.dims
+            return other.value, other.error, other.dims
+        values = numpy.asarray(other, dtype=numpy.float64)
+        return values, 0.0, dims
+
+    def __add__(self, other):
+        """
+        >>> print((NumberArray([1, 2], [1, 1]) + 1)[0])
+        2.00 ± 1.00
+        """
+        b, db, dims = self._operand(other, self.dims)
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        a, da = self.values, self.errors
+        if self is other:
+            dc = 2.*da
+        else:
+            dc = numpy.hypot(da, db)
+        return NumberArray._new(a+b, dc, self.dims)
+
+    def __radd__(self, other):
+        return self+other
+
+    def __sub__(self, other):
+        b, db, dims = self._operand(other, self.dims)
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        a, da = self.values, self.errors
+        if self is other:
+            dc = numpy.zeros_like(da)
+        else:
+            dc = numpy.hypot(da, db)
+        return NumberArray._new(a-b, dc, self.dims)
+
+    def __rsub__(self, other):
+        x = self-other
+        x.values *= -1
+        return x
+
+    def __mul__(self, other):
+        """
+        >>> print((NumberArray([4], [2]) * Number(7, 3))[0])
+        (2.80 ± 1.84)x10
+        """
+        b, db, dims = self._operand(other, PURE)
+        a, da = self.values, self.errors
+        if self is other:
+            dc = 2.0*da*a
+        else:
+            dc = numpy.hypot(da*b, db*a)
+        dims = self.dims*dims
+        return NumberArray._new(a*b, dc, dims)
+
+    def __rmul__(self, other):
+        return self*other
+
+    def __div__(self, other):
+        """
+        >>> print((NumberArray([4], [2]) / Number(7, 3))[0])
+        (5.71 ± 3.76)/10
+        """
+        b, db, dims = self._operand(other, PURE)
+        a, da = self.values, self.errors
+        if self is other:
+            dc = numpy.zeros_like(da)
+        else:
+            dc = numpy.hypot(da/b, (a*db)/(b*b))
+        dims = self.dims/dims
+        return NumberArray._new(a/b, dc, dims)
+
+    def __rdiv__(self, other):
+        """
+        >>> print((1 / NumberArray([2], [1]))[0])
+        (5.00 ± 2.50)/10
+        """
+        b, db, dims = self._operand(other, PURE)
+        return NumberArray._new(numpy.asarray(b, dtype=numpy.float64),
+                                numpy.broadcast_to(db, numpy.shape(b)),
+                                dims)/self
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        """
+        the exponent must be a pure scalar (or a pure array if the
+        base is pure, so that the result has a single Dimension)
+
+        >>> x = NumberArray([2, 3], [0.1, 0.1], 'meter')
+        >>> print((x**2)[1])
+        9.000 ± 0.600
+        >>> (x**2).units()
+        'meter^2'
+        >>> (NumberArray([0, 2], 0, 'meter')**2).errors
+        array([0., 0.])
+        """
+        b, db, dims = self._operand(other, PURE)
+        if dims is not PURE:
+            raise RuntimeError("Incompatible Dimensions")
+        if numpy.ndim(b) == 0:
+            b = float(b)
+            dims = self.dims**b
+        elif self.is_pure():
+            dims = self.dims
+        else:
+            raise RuntimeError("Incompatible Dimensions")
+        a, da = self.values, self.errors
+        c = a**b
+        # as in Number, exact elements propagate no error, also where
+        # the value is 0 (no da/a) or not positive (no log(a))
+        exact = da == 0
+        dc = numpy.where(exact, 0.0, da*b/numpy.where(exact, 1.0, a))
+        if numpy.any(db):
+            exact = numpy.equal(db, 0)
+            dc = numpy.hypot(dc, numpy.where(
+                    exact, 0.0, db*numpy.log(numpy.where(exact, 1.0, a))))
+        return NumberArray._new(c, numpy.abs(c*dc), dims)
+
+    def __neg__(self):
+        return NumberArray._new(-self.values, self.errors, self.dims)
+
+    def convert(self, dims):
+        """
+        >>> NumberArray([1000, 2000], 0, 'meter').convert('kilometer').values
+        array([1., 2.])
+        """
+        n, dims = unit_cache.lookup(dims)
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        return NumberArray._new(self.values/n, self.errors/n, PURE)
+
+    def is_pure(self):
+        return self.dims is PURE
+
+    def units(self):
+        return self.dims.units()
+
+    def _pure(self):
+        if not self.is_pure():
+            raise RuntimeError("Incompatible Dimensions")
+
+    def sin(self):
+        self._pure()
+        return NumberArray._new(numpy.sin(self.values),
+                                numpy.abs(numpy.cos(self.values))*self.errors,
+                                self.dims)
+
+    def cos(self):
+        self._pure()
+        return NumberArray._new(numpy.cos(self.values),
+                                numpy.abs(numpy.sin(self.values))*self.errors,
+                                self.dims)
+
+    def exp(self):
+        self._pure()
+        c = numpy.exp(self.values)
+        return NumberArray._new(c, numpy.abs(c)*self.errors, self.dims)
+
+    def log(self):
+        """
+        >>> from buckingham import log
+        >>> print(log(NumberArray([1.0], [0.1]))[0])
+        0.000 ± 0.100
+        """
+        self._pure()
+        return NumberArray._new(numpy.log(self.values),
+                                numpy.abs(self.errors/self.values),
+                                self.dims)
+
+    def _reduce(self, values, errors):
+        if numpy.ndim(values) == 0:
+            return Number._new(float(values), float(errors), self.dims)
+        return NumberArray._new(values, errors, self.dims)
+
+    def sum(self, axis=None):
+        """
+        errors are combined in quadrature
+
+        >>> print(NumberArray([1, 2], [3, 4]).sum())
+        3.00 ± 5.00
+        """
+        return self._reduce(self.values.sum(axis=axis),
+                            numpy.sqrt((self.errors**2).sum(axis=axis)))
+
+    def mean(self, axis=None):
+        """
+        >>> print(NumberArray([1, 2], [3, 4]).mean())
+        1.50 ± 2.50
+        """
+        n = self.values.size if axis is None else self.values.shape[axis]
+        total = self.sum(axis=axis)
+        if isinstance(total, Number):
+            return Number._new(total.value/n, total.error/n, self.dims)
+        return NumberArray._new(total.values/n, total.errors/n, self.dims)
+
+    def min(self):
+        return self[numpy.unravel_index(numpy.argmin(self.values), self.shape)]
+
+    def max(self):
+        return self[numpy.unravel_index(numpy.argmax(self.values), self.shape)]
+
+    def __repr__(self):
+        return 'NumberArray(%r, %r, %r)' % (
+            self.values, self.errors, self.units())
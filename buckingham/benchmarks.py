@@ -0,0 +1,592 @@
+# -*- coding: utf-8 -*-
+"""
+Micro benchmarks for buckingham
+
+Run with
+
+    python -m buckingham.benchmarks
+
+Each benchmark returns a list of (name, microseconds per call) pairs,
+except bench_memory which returns (name, bytes per instance) pairs.
+
+Results can be saved as JSON and compared with a baseline, which fails
+(exit status 1) if any result is slower than the baseline by more than
+a threshold ratio:
+
+    python -m buckingham.benchmarks --save results.json \\
+        --compare buckingham/benchmarks.json --threshold 1.5
+
+or simply "make bench". "make bench-baseline" rewrites the baseline
+shipped with the package. Thresholds for a benchmark or for a single
+result ("bench_import" or "bench_import:import re") can be stored in the
+"thresholds" of the baseline file or given with --threshold NAME=RATIO.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+from buckingham import Dimension, Fraction, Number, UNITS, allunits, \
+    buckingham, converter, extend_units, format_numbers, parse_units, \
+    unit_cache
+
+def measure(func, number=20000, repeat=3):
+    """ returns the best time of a call to func, in microseconds """
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return 1e6*best/number
+
+def bench_arithmetic(number=20000):
+    """
+    compares the cost of the operators with the cost of building a
+    Number from a dims tuple and the cost of building a plain object
+
+    >>> names = [name for name, t in bench_arithmetic(number=10)]
+    >>> names[:3]
+    ['object()', 'Number._new(...)', 'Number(v, e, dims tuple)']
+    """
+    a = Number(10, 2, 'meter/second')
+    b = Number(5, 1, 'meter/second')
+    dims = a.dims
+    class Plain(object):
+        pass
+    return [
+        ('object()', measure(Plain, number)),
+        ('Number._new(...)', measure(lambda: Number._new(1.0, 0.0, dims), number)),
+        ('Number(v, e, dims tuple)', measure(lambda: Number(1.0, 0.0, dims), number)),
+        ('a + b', measure(lambda: a + b, number)),
+        ('a - b', measure(lambda: a - b, number)),
+        ('a * b', measure(lambda: a * b, number)),
+        ('a / b', measure(lambda: a / b, number)),
+        ('a ** 2', measure(lambda: a ** 2, number)),
+        ('2 * a', measure(lambda: 2 * a, number)),
+        ]
+
+def bench_exact(number=20000):
+    """
+    the operators on exact quantities (error = 0), which skip the
+    propagation of errors, and on a mix of exact and uncertain ones
+
+    >>> [name for name, t in bench_exact(number=10)][:2]
+    ['a + b', 'a * b']
+    """
+    a = Number(10, 0, 'meter/second')
+    b = Number(5, 0, 'meter/second')
+    c = Number(5, 1, 'meter/second')
+    return [
+        ('a + b', measure(lambda: a + b, number)),
+        ('a * b', measure(lambda: a * b, number)),
+        ('a / b', measure(lambda: a / b, number)),
+        ('a ** 2', measure(lambda: a ** 2, number)),
+        ('5 * a', measure(lambda: 5 * a, number)),
+        ('1 / a', measure(lambda: 1 / a, number)),
+        ('a * c (one uncertain)', measure(lambda: a * c, number)),
+        ]
+
+def bench_units(number=20000):
+    """
+    compares parsing a unit string with looking it up in the unit cache,
+    and convert() with a precompiled converter
+
+    >>> [name for name, t in bench_units(number=10)][0]
+    "parse_units('kilometer/hour')"
+    """
+    a = Number(10, 2, 'meter/second')
+    f = converter('meter/second', 'mile/hour')
+    return [
+        ("parse_units('kilometer/hour')",
+         measure(lambda: parse_units('kilometer/hour'), number)),
+        ("unit_cache.lookup('kilometer/hour')",
+         measure(lambda: unit_cache.lookup('kilometer/hour'), number)),
+        ("Number(1, 0, 'kilometer/hour')",
+         measure(lambda: Number(1, 0, 'kilometer/hour'), number)),
+        ("a.convert('mile/hour')",
+         measure(lambda: a.convert('mile/hour'), number)),
+        ("converter(...)(10.0)",
+         measure(lambda: f(10.0), number)),
+        ("converter(...)(10.0, 2.0)",
+         measure(lambda: f(10.0, 2.0), number)),
+        ("a.guess()", measure(a.guess, number)),
+        ("a.auto_convert()", measure(a.auto_convert, number)),
+        ]
+
+def bench_construction(number=20000):
+    """
+    Number.__init__ with the dims given as a unit string, as a tuple of
+    exponents and as a Dimension
+
+    >>> [name for name, t in bench_construction(number=10)][0]
+    "Number(1, 0.1, 'meter/second')"
+    """
+    dims = Dimension((1, -1, 0, 0, 0, 0))
+    return [
+        ("Number(1, 0.1, 'meter/second')",
+         measure(lambda: Number(1, 0.1, 'meter/second'), number)),
+        ("Number(1, 0.1, 'kilogram*meter^2/second^2')",
+         measure(lambda: Number(1, 0.1, 'kilogram*meter^2/second^2'), number)),
+        ('Number(1, 0.1, (1, -1, 0, 0, 0, 0))',
+         measure(lambda: Number(1, 0.1, (1, -1, 0, 0, 0, 0)), number)),
+        ('Number(1, 0.1, Dimension)',
+         measure(lambda: Number(1, 0.1, dims), number)),
+        ]
+
+def bench_formatting(number=20000):
+    """
+    >>> [name for name, t in bench_formatting(number=10)][0]
+    'as_string() with error'
+    """
+    a = Number(1234.5, 6.7, 'meter')
+    b = Number(1234.5, 0, 'meter')
+    generator = random.Random(0)
+    numbers = [Number(10**generator.uniform(-5, 5), 10**generator.uniform(-6, 4))
+               for i in range(number)]
+    return [
+        ('as_string() with error', measure(a.as_string, number)),
+        ('as_string() exact', measure(b.as_string, number)),
+        ('as_latex() with error', measure(a.as_latex, number)),
+        ('as_latex() exact', measure(b.as_latex, number)),
+        ('str() in a loop, per number',
+         measure(lambda: [str(x) for x in numbers], 1)/len(numbers)),
+        ('format_numbers(), per number',
+         measure(lambda: list(format_numbers(numbers)), 1)/len(numbers)),
+        ]
+
+def bench_tables(number=20):
+    """
+    allunits() and the per-exponent buckingham() used by the legacy parser
+
+    >>> [name for name, t in bench_tables(number=1)][0]
+    'allunits()'
+    """
+    table = LegacyParser().c[1]
+    return [
+        ('allunits()', measure(allunits, number)),
+        ("buckingham('kilogram*meter^2/second^2')",
+         measure(lambda: buckingham('kilogram*meter^2/second^2', table),
+                 1000*number)),
+        ]
+
+def bench_fraction(number=20000):
+    """
+    >>> [name for name, t in bench_fraction(number=10)][0]
+    'Fraction(1, 2)'
+    """
+    a, b = Fraction(1, 2), Fraction(1, 3)
+    return [
+        ('Fraction(1, 2)', measure(lambda: Fraction(1, 2), number)),
+        ("Fraction('3/4')", measure(lambda: Fraction('3/4'), number)),
+        ('a + b', measure(lambda: a + b, number)),
+        ('a - b', measure(lambda: a - b, number)),
+        ('a * b', measure(lambda: a * b, number)),
+        ('a == b', measure(lambda: a == b, number)),
+        ]
+
+class LegacyFraction(object):
+    """ layout of Fraction before __slots__ """
+    def __init__(self, n, d):
+        self.n, self.d = n, d
+
+class LegacyNumber(object):
+    """ layout of Number before __slots__ and Dimension """
+    def __init__(self, value, error, dims):
+        self.value = value
+        self.error = error
+        self.dims = tuple(LegacyFraction(x.n, x.d) for x in dims)
+
+def bytes_per_instance(factory, count):
+    """ bytes allocated per item by [factory(i) for i in range(count)] """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        items = [factory(i) for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del items
+    return float(after-before)/count
+
+def bench_memory(count=100000):
+    """
+    bytes per instance of a list of Numbers sharing the same dims,
+    compared with the layout used before __slots__ and Dimension
+
+    >>> (legacy, a), (current, b) = bench_memory(count=10000)
+    >>> a > 4*b
+    True
+    """
+    dims = Number(1, 0, 'meter/second').dims
+    return [
+        ('legacy Number', bytes_per_instance(
+                lambda i: LegacyNumber(float(i), 0.1, dims), count)),
+        ('Number', bytes_per_instance(
+                lambda i: Number._new(float(i), 0.1, dims), count)),
+        ]
+
+def import_time(module='buckingham', repeat=5):
+    """
+    best cumulative import time of module in microseconds, as reported
+    by python -X importtime in a fresh interpreter (bytecode cached)
+    """
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, '-X', 'importtime', '-c', 'import '+module]
+    times = []
+    for k in range(repeat+1):
+        output = subprocess.Popen(command, env=env, stderr=subprocess.PIPE,
+                                  universal_newlines=True).communicate()[1]
+        for line in output.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                times.append(int(fields[1]))
+    # the first run writes the bytecode cache
+    return min(times[1:])
+
+class LegacyParser(object):
+    """ the regex + eval + 6 x buckingham() parsing used before UnitParser """
+    regex = re.compile(r'([a-zA-Z]+)(\^\-?\d+(/\d+)?)?(\*([a-zA-Z]+)(\^\-?\d+(/\d+)?)?)*(\/([a-zA-Z]+)(\^\-?\d+(/\d+)?)?)*')
+
+    def __init__(self):
+        units = dict(UNITS)
+        extend_units(units)
+        self.c = [dict((key, value[i]) for key, value in units.items())
+                  for i in range(7)]
+
+    def parse(self, dims):
+        dims = dims.replace(' ','')
+        if not self.regex.match(dims):
+            raise SyntaxError('Invalid Dims')
+        n = eval(dims.replace('^','**'), self.c[0]) or 1
+        return n, Dimension([buckingham(dims, self.c[i]) for i in range(1, 7)])
+
+def bench_parser(number=2000):
+    """
+    compares UnitParser with the legacy regex + eval + buckingham() path,
+    both uncached
+
+    >>> [name for name, t in bench_parser(number=10)][:2]
+    ["legacy 'kilometer/hour'", "parse_units 'kilometer/hour'"]
+    """
+    legacy = LegacyParser()
+    results = []
+    for dims in ('kilometer/hour', 'kilogram*meter^2/second^2',
+                 'mile*mile*mile/hour/hour'):
+        results.append(('legacy %r' % dims,
+                        measure(lambda: legacy.parse(dims), number)))
+        results.append(('parse_units %r' % dims,
+                        measure(lambda: parse_units(dims), number)))
+    return results
+
+FUZZ_TOKENS = ['meter', 'kilometer', 'second', 'hour', 'gram', 'mile', 'N',
+               '*', '/', '^', '(', ')', '-', '1', '2', '3', ' ', '.', ',',
+               '**', '__import__', 'os', '"', "'", '[', ']', 'lambda', ':',
+               '1/2', 'e', '+', '\\', ';', '=', 'x', 'meter.__class__']
+
+def fuzz_parser(count=10000, seed=0):
+    """
+    feeds random token soups to parse_units and checks that each one is
+    either rejected with SyntaxError/RuntimeError or parsed to a
+    (float, Dimension) pair made only of grammar characters.
+    on strings the legacy parser also accepts, the two must agree.
+    returns (accepted, rejected)
+
+    >>> accepted, rejected = fuzz_parser(count=2000)
+    >>> accepted > 0 and rejected > 0
+    True
+    """
+    generator = random.Random(seed)
+    legacy = LegacyParser()
+    allowed = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_'
+                  '0123456789*/^()+- ')
+    accepted = rejected = 0
+    for k in range(count):
+        dims = ''.join(generator.choice(FUZZ_TOKENS)
+                       for i in range(generator.randint(1, 8)))
+        try:
+            scale, d = parse_units(dims)
+        except (SyntaxError, RuntimeError):
+            rejected += 1
+            continue
+        accepted += 1
+        assert isinstance(scale, float) or isinstance(scale, int), dims
+        assert isinstance(d, Dimension), dims
+        assert set(dims) <= allowed, dims
+        try:
+            old_scale, old_d = legacy.parse(dims)
+        except Exception:
+            continue
+        normalized = dims.replace(' ', '')
+        if legacy.regex.match(normalized).end() == len(normalized):
+            assert abs(old_scale-scale) <= 1e-9*abs(scale) and old_d is d, dims
+    return accepted, rejected
+
+def bench_import(repeat=5):
+    """
+    import time of buckingham compared with the eager expansion of
+    the prefixed units that used to run at import
+
+    >>> [name for name, t in bench_import(repeat=1)]
+    ['import buckingham', 'import re', 'extend_units(UNITS)']
+    """
+    return [
+        ('import buckingham', import_time('buckingham', repeat)),
+        ('import re', import_time('re', repeat)),
+        ('extend_units(UNITS)',
+         measure(lambda: extend_units(dict(UNITS)), 10, repeat)),
+        ]
+
+def bench_correlated(count=10000, number=3):
+    """
+    time to sum count independent Correlated inputs and then to collapse
+    the error of the result, which must grow linearly with count
+
+    >>> [name for name, t in bench_correlated(count=10, number=1)]
+    ['sum of 10 Numbers', 'sum of 10 Correlated', 'error of the sum']
+    """
+    from buckingham.correlated import Correlated
+    numbers = [Number(1.0, 0.1, 'dollar') for i in range(count)]
+    inputs = [Correlated(1.0, 0.1, 'dollar') for i in range(count)]
+    total = sum(inputs[1:], inputs[0])
+    def collapse():
+        total._error = None
+        return total.error
+    return [
+        ('sum of %i Numbers' % count,
+         measure(lambda: sum(numbers[1:], numbers[0]), number)),
+        ('sum of %i Correlated' % count,
+         measure(lambda: sum(inputs[1:], inputs[0]), number)),
+        ('error of the sum', measure(collapse, number)),
+        ]
+
+def bench_compile(number=20000):
+    """
+    compares a formula evaluated on Numbers with the same formula
+    compiled by buckingham.compile and called on floats
+
+    >>> [name for name, t in bench_compile(number=10)]
+    ['formula on Numbers', 'compiled kernel on floats', 'compile (once)']
+    """
+    from buckingham import compile
+    g = Number(9.81, 0, 'meter/second^2')
+    def energy(m, v, h):
+        return (0.5*m*v**2 + m*g*h).convert('joule')
+    m = Number(2, 0.1, 'kilogram')
+    v = Number(36, 3.6, 'kilometer/hour')
+    h = Number(1, 0.1, 'meter')
+    kernel = compile(lambda m, v, h: 0.5*m*v**2 + m*g*h,
+                     m='kilogram', v='kilometer/hour', h='meter'
+                     ).convert('joule')
+    return [
+        ('formula on Numbers', measure(lambda: energy(m, v, h), number)),
+        ('compiled kernel on floats',
+         measure(lambda: kernel((2.0, 0.1), (36.0, 3.6), (1.0, 0.1)), number)),
+        ('compile (once)', measure(lambda: compile(
+                    energy, m='kilogram', v='kilometer/hour', h='meter'),
+                                   max(1, number//100))),
+        ]
+
+def bench_schema(number=20000):
+    """
+    checking the dimensions of the fields of a record by building
+    Numbers and catching the RuntimeError, against a compiled
+    DimensionSchema
+
+    >>> [name for name, t in bench_schema(number=10)]
+    ['Numbers and except', 'Validator.validate', 'Validator.validate (invalid)']
+    """
+    from buckingham.schema import DimensionSchema
+    fields = {'pressure': 'psi', 'depth': 'meter', 'rate': 'liter/minute'}
+    record = {'pressure': (14.7, 0.1, 'psi'), 'depth': (3, 0, 'foot'),
+              'rate': (2, 0, 'meter^3/hour')}
+    invalid = dict(record, rate=(2, 0, 'meter^3'))
+    expected = dict((field, Number(1, 0, units)) for field, units in fields.items())
+    def catch(record):
+        errors = []
+        for field, (value, error, units) in record.items():
+            try:
+                Number(value, error, units) + expected[field]
+            except RuntimeError:
+                errors.append(field)
+        return errors
+    validator = DimensionSchema(fields).compile()
+    return [
+        ('Numbers and except', measure(lambda: catch(record), number)),
+        ('Validator.validate', measure(lambda: validator.validate(record),
+                                       number)),
+        ('Validator.validate (invalid)',
+         measure(lambda: validator.validate(invalid), number)),
+        ]
+
+def bench_sum(count=100000, number=3):
+    """
+    time per term of sum() over Numbers and of fsum and Accumulator
+
+    >>> [name for name, t in bench_sum(count=10, number=1)]
+    ['sum(numbers)', 'fsum(numbers)', 'Accumulator += (loop)']
+    """
+    from buckingham import Accumulator, fsum
+    numbers = [Number(random.random(), 0.01, 'dollar') for i in range(count)]
+    def accumulate():
+        total = Accumulator()
+        for x in numbers:
+            total += x
+        return total.number()
+    return [
+        ('sum(numbers)',
+         measure(lambda: sum(numbers[1:], numbers[0]), number)/count),
+        ('fsum(numbers)', measure(lambda: fsum(numbers), number)/count),
+        ('Accumulator += (loop)', measure(accumulate, number)/count),
+        ]
+
+def bench_parallel(count=20000, workers=(1, 2, 4), chunksize=1000):
+    """
+    time per record of map_evaluate in this process and in pools of
+    workers. the pools can only be faster with as many free cores as
+    workers; the times include starting the pool
+
+    >>> [name for name, t in bench_parallel(count=10, workers=(1,))]
+    ['in process', '1 workers']
+    """
+    from buckingham import map_evaluate
+    records = [((i, 0.1, 'mile'), (1.0, 0.01, 'hour')) for i in range(count)]
+    def run(n):
+        for result in map_evaluate(speed, records, workers=n,
+                                   chunksize=chunksize, units=('mile', 'hour')):
+            pass
+    items = [('in process', measure(lambda: run(0), 1)/count)]
+    for n in workers:
+        items.append(('%i workers' % n, measure(lambda: run(n), 1)/count))
+    return items
+
+def speed(distance, time):
+    return (distance/time).convert('kilometer/hour')
+
+def bench_array(count=1000000, number=3):
+    """
+    time per element of converting measurements as a NumberArray of count
+    elements and as a list of Numbers (count/100 of them). empty without
+    numpy
+
+    >>> [name for name, t in bench_array(count=100, number=1)]
+    ['NumberArray.convert()', 'Number.convert() (loop)']
+    """
+    try:
+        from buckingham.array import NumberArray
+    except ImportError:
+        return []
+    x = NumberArray([random.random() for i in range(count)], 0.01,
+                    'kilometer')
+    numbers = x[:count//100].to_numbers()
+    return [
+        ('NumberArray.convert()',
+         measure(lambda: x.convert('meter'), number)/count),
+        ('Number.convert() (loop)',
+         measure(lambda: [n.convert('meter') for n in numbers],
+                 number)/len(numbers)),
+        ]
+
+BENCHMARKS = [bench_construction, bench_arithmetic, bench_exact, bench_units,
+              bench_formatting, bench_tables, bench_fraction, bench_parser,
+              bench_memory, bench_import, bench_correlated, bench_compile,
+              bench_schema, bench_sum, bench_parallel, bench_array]
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'benchmarks.json')
+
+def run(benchmarks=BENCHMARKS, out=None):
+    """ runs the benchmarks and returns {bench name: {name: result}} """
+    results = {}
+    for bench in benchmarks:
+        if out:
+            out.write('%s\n' % bench.__name__)
+        results[bench.__name__] = items = {}
+        for name, t in bench():
+            items[name] = t
+            if out:
+                unit = 'bytes' if bench is bench_memory else 'us'
+                out.write('  %-44s %10.3f %s\n' % (name, t, unit))
+    return results
+
+def compare(results, baseline, threshold=1.5, thresholds=None):
+    """
+    returns a list of (bench, name, baseline, result, ratio) for every
+    result that exceeds its baseline by more than its threshold ratio,
+    and with baseline and ratio None for every result that is not in the
+    baseline, which is a failure too. thresholds maps a bench name or
+    "bench:name" to a ratio
+
+    >>> compare({'b': {'x': 2.0, 'y': 1.0}}, {'b': {'x': 1.0, 'y': 1.0}},
+    ...         thresholds={'b:x': 1.5})
+    [('b', 'x', 1.0, 2.0, 2.0)]
+    >>> compare({'b': {'x': 2.0}}, {'b': {'x': 1.0}}, thresholds={'b': 3})
+    []
+    >>> compare({'b': {'x': 1.0}, 'c': {'y': 1.0}}, {'b': {'x': 1.0}})
+    [('c', 'y', None, 1.0, None)]
+    """
+    thresholds = thresholds or {}
+    regressions = []
+    for bench in sorted(results):
+        for name in sorted(results[bench]):
+            old = baseline.get(bench, {}).get(name)
+            if old is None:
+                regressions.append((bench, name, None, results[bench][name],
+                                    None))
+                continue
+            if not old:
+                continue
+            ratio = results[bench][name]/old
+            limit = thresholds.get('%s:%s' % (bench, name),
+                                   thresholds.get(bench, threshold))
+            if ratio > limit:
+                regressions.append((bench, name, old, results[bench][name],
+                                    ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m buckingham.benchmarks')
+    parser.add_argument('--only', action='append', default=[],
+                        help='run only this benchmark (may be repeated)')
+    parser.add_argument('--save', help='save the results as JSON')
+    parser.add_argument('--compare', nargs='?', const=BASELINE,
+                        help='compare with a baseline JSON file '
+                        '(default the one shipped with buckingham)')
+    parser.add_argument('--threshold', action='append', default=[],
+                        help='RATIO or NAME=RATIO, slowdown that counts as '
+                        'a regression (default 1.5)')
+    options = parser.parse_args(argv)
+    benchmarks = [bench for bench in BENCHMARKS
+                  if not options.only or bench.__name__ in options.only]
+    results = run(benchmarks, sys.stdout)
+    if options.save:
+        with open(options.save, 'w') as stream:
+            json.dump(dict(python=sys.version.split()[0],
+                           platform=platform.platform(),
+                           results=results), stream, indent=1, sort_keys=True)
+    if not options.compare:
+        return 0
+    with open(options.compare) as stream:
+        baseline = json.load(stream)
+    threshold, thresholds = 1.5, dict(baseline.get('thresholds', {}))
+    for item in options.threshold:
+        if '=' in item:
+            name, ratio = item.rsplit('=', 1)
+            thresholds[name] = float(ratio)
+        else:
+            threshold = float(item)
+    regressions = compare(results, baseline['results'], threshold, thresholds)
+    for bench, name, old, new, ratio in regressions:
+        if old is None:
+            print('MISSING %s %s: not in the baseline, run make '
+                  'bench-baseline' % (bench, name))
+            continue
+        print('REGRESSION %s %s: %.3f -> %.3f (x%.2f)' % (bench, name, old,
+                                                          new, ratio))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+First-order error propagation for correlated quantities
+
+Number assumes that the operands of every operation are independent,
+so a quantity that enters a formula twice is counted twice:
+
+    >>> from buckingham import Number
+    >>> a, b = Number(2, 1), Number(3, 2)
+    >>> print((a+b)-a)
+    3.00 ± 2.45
+
+A Correlated number remembers how it was computed. Each one created
+with the constructor is an independent source of uncertainty, and each
+operation records the partial derivatives of its result with respect to
+its operands. The error is collapsed to a standard deviation only when
+it is read, by accumulating the derivatives with respect to the sources
+in one pass over the operations (reverse mode), so the cost grows
+linearly with the size of the formula:
+
+    >>> a, b = Correlated(2, 1), Correlated(3, 2)
+    >>> print((a+b)-a)
+    3.00 ± 2.00
+    >>> print(a*b/a)
+    3.00 ± 2.00
+
+Plain Numbers and scalars can be mixed in: a Number with an error is
+treated as a new independent source.
+
+    >>> coupon = Correlated(200, 1, 'dollar/day')
+    >>> payoff = coupon*Number(1, 0, 'year') - coupon*Number(1, 0, 'day')
+    >>> print(payoff.convert('dollar'))
+    (7.2848 ± 0.0364)x10^4
+"""
+
+import itertools
+import math
+
+from buckingham import Number, PURE, unit_cache
+
+__all__ = ['Correlated', 'covariance']
+
+class Node(object):
+    """
+    one step of a computation. a source has an id and a standard
+    deviation sigma and no parents; a derived node has parents, a tuple
+    of (partial derivative, parent node) pairs
+    """
+    __slots__ = ('parents', 'sigma', 'id')
+    ids = itertools.count()
+
+    def __init__(self, parents=(), sigma=None):
+        self.parents = parents
+        self.sigma = sigma
+        self.id = next(self.ids) if sigma is not None else None
+
+    def __getstate__(self):
+        return (None, {'parents': self.parents, 'sigma': self.sigma,
+                       'id': self.id})
+
+def gradient(node):
+    """
+    returns {source node: partial derivative of node with respect to it},
+    visiting each node reachable from node once. nodes reached by paths
+    of different lengths get the contributions of all of them
+
+    >>> a = Correlated(2, 1)
+    >>> print(a + a*3)
+    8.00 ± 4.00
+    >>> x = Correlated(3, 0.1)
+    >>> print(x + x**2)
+    (1.2000 ± 0.0700)x10
+    """
+    order, seen, stack = [], set(), [(node, False)]
+    while stack:
+        current, done = stack.pop()
+        if done:
+            order.append(current)
+            continue
+        # a node is marked when it is expanded, not when it is pushed, so
+        # it enters the post-order only after all of its parents
+        if current in seen:
+            continue
+        seen.add(current)
+        stack.append((current, True))
+        for coefficient, parent in current.parents:
+            if not parent in seen:
+                stack.append((parent, False))
+    # order is a post-order, so reversed it lists children before parents
+    adjoints = {node: 1.0}
+    sources = {}
+    for current in reversed(order):
+        adjoint = adjoints.pop(current, 0.0)
+        if current.sigma is not None:
+            sources[current] = adjoint
+        for coefficient, parent in current.parents:
+            adjoints[parent] = adjoints.get(parent, 0.0) + adjoint*coefficient
+    return sources
+
+class Correlated(Number):
+    """
+    a Number that tracks the partial derivatives of its value with
+    respect to the independent sources it was computed from
+    """
+    __slots__ = ('node', '_error')
+
+    # unlike a Number, a Correlated caches its error when it is read and
+    # is equal only to itself, since equal values may have different
+    # derivatives
+    __setattr__ = object.__setattr__
+    __delattr__ = object.__delattr__
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+    def __init__(self, value, error=0.0, dims='N'):
+        number = Number(value, error, dims)
+        self.value, self.dims = number.value, number.dims
+        self._error = number.error
+        self.node = Node(sigma=self._error)
+
+    def __getstate__(self):
+        """
+        the derivatives are pickled with the number, so that copies
+        stay correlated with each other
+
+        >>> import pickle
+        >>> a = Correlated(2, 1)
+        >>> b = pickle.loads(pickle.dumps((a, a+a), 0))
+        >>> print(b[1]-2*b[0])
+        (0.000000 ± 0)
+        """
+        return (None, {'value': self.value, 'dims': self.dims,
+                       '_error': self._error, 'node': self.node})
+
+    @classmethod
+    def _new(cls, value, error, dims):
+        """
+        a new independent source from a value and error already in
+        canonical units
+
+        >>> x = Correlated._new(2.0, 0.5, PURE)
+        >>> print(x - x/2)
+        1.000 ± 0.250
+        """
+        self = cls.__new__(cls)
+        self.value = value
+        self.dims = dims
+        self._error = error
+        self.node = Node(sigma=error)
+        return self
+
+    @property
+    def error(self):
+        if self._error is None:
+            self._error = math.sqrt(sum(
+                (partial*source.sigma)**2
+                for source, partial in gradient(self.node).items()))
+        return self._error
+
+    @error.setter
+    def error(self, error):
+        self._error = error
+
+    @classmethod
+    def _derived(cls, value, dims, *parents):
+        """
+        builds the result of an operation from its value and its
+        (partial derivative, node) pairs, skipping exact operands
+        """
+        self = cls.__new__(cls)
+        self.value = value
+        self.dims = dims
+        self._error = None
+        self.node = Node(tuple((c, node) for c, node in parents
+                               if node is not None and c))
+        return self
+
+    @staticmethod
+    def _operand(other, dims):
+        """
+        returns (value, dims, node) of other, or None if other is not a
+        number. scalars are exact and take the given dims
+        """
+        if isinstance(other, Correlated):
+            return other.value, other.dims, other.node
+        if isinstance(other, Number):
+            node = Node(sigma=other.error) if other.error else None
+            return other.value, other.dims, node
+        try:
+            return float(other), dims, None
+        except TypeError:
+            return None
+
+    def gradient(self):
+        """
+        returns {source id: partial derivative}, in canonical units
+
+        >>> x = Correlated(3, 1)
+        >>> y = x*x + 1
+        >>> list(y.gradient().values())
+        [6.0]
+        """
+        return dict((source.id, partial)
+                    for source, partial in gradient(self.node).items())
+
+    def covariance(self, other):
+        """
+        >>> x = Correlated(3, 1)
+        >>> print(x.covariance(-2*x))
+        -2.0
+        """
+        return covariance(self, other)
+
+    def __add__(self, other):
+        operand = self._operand(other, self.dims)
+        if operand is None:
+            return NotImplemented
+        b, dims, node = operand
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        return self._derived(self.value+b, dims, (1.0, self.node), (1.0, node))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        operand = self._operand(other, self.dims)
+        if operand is None:
+            return NotImplemented
+        b, dims, node = operand
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        return self._derived(self.value-b, dims, (1.0, self.node), (-1.0, node))
+
+    def __rsub__(self, other):
+        operand = self._operand(other, self.dims)
+        if operand is None:
+            return NotImplemented
+        b, dims, node = operand
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        return self._derived(b-self.value, dims, (-1.0, self.node), (1.0, node))
+
+    def __mul__(self, other):
+        operand = self._operand(other, PURE)
+        if operand is None:
+            return NotImplemented
+        a, (b, dims, node) = self.value, operand
+        return self._derived(a*b, self.dims*dims, (b, self.node), (a, node))
+
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        operand = self._operand(other, PURE)
+        if operand is None:
+            return NotImplemented
+        a, (b, dims, node) = self.value, operand
+        c = a/b
+        return self._derived(c, self.dims/dims, (1.0/b, self.node),
+                             (-c/b, node))
+
+    def __rdiv__(self, other):
+        """
+        >>> print(1 / Correlated(2, 1))
+        (5.00 ± 2.50)/10
+        """
+        operand = self._operand(other, PURE)
+        if operand is None:
+            return NotImplemented
+        a, (b, dims, node) = self.value, operand
+        c = b/a
+        return self._derived(c, dims/self.dims, (-c/a, self.node),
+                             (1.0/a, node))
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        """
+        the logarithm of the base only enters if the exponent is
+        uncertain, so exact powers of negative numbers work
+
+        >>> print(Correlated(-2, 0.1)**2)
+        4.000 ± 0.400
+        """
+        operand = self._operand(other, PURE)
+        if operand is None:
+            return NotImplemented
+        a, (b, dims, node) = self.value, operand
+        if dims is not PURE:
+            raise RuntimeError("Incompatible Dimentions")
+        c = a**b
+        db = c*math.log(a) if node is not None else 0.0
+        return self._derived(c, self.dims**b, (b*a**(b-1), self.node),
+                             (db, node))
+
+    def _apply(self, value, derivative):
+        return self._derived(value, self.dims, (derivative, self.node))
+
+    def convert(self, dims):
+        n, dims = unit_cache.lookup(dims)
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        return self._derived(self.value/n, PURE, (1.0/n, self.node))
+
+    def purify(self, force=False):
+        if not force and not self.is_pure():
+            raise RuntimeError("Try purify(force = True)")
+        return self._derived(self.value, PURE, (1.0, self.node))
+
+def covariance(x, y):
+    """
+    covariance of two Correlated numbers, in canonical units
+
+    >>> a, b = Correlated(1, 0.5), Correlated(1, 0.5)
+    >>> print(covariance(a+b, a-b))
+    0.0
+    >>> print(covariance(a, a + a*3))
+    1.0
+    """
+    gx, gy = gradient(x.node), gradient(y.node)
+    if len(gy) < len(gx):
+        gx, gy = gy, gx
+    return sum(partial*gy[source]*source.sigma**2
+               for source, partial in gx.items() if source in gy)
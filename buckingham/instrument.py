@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of the hot paths of buckingham
+
+While a Profiler is active the functions below are replaced by wrappers
+that count calls and add up their time; when no Profiler is active the
+original functions are restored, so the disabled path costs nothing.
+
+    phase        wraps
+    construct    Number.__init__
+    lookup       UnitCache.lookup       (also counted per unit string)
+    parse        parse_units            (also counted per unit string)
+    buckingham   buckingham
+    fraction     Fraction.__init__
+    convert      Number.convert, Converter.__call__
+    operators    Number.__add__, __sub__, __mul__, __div__, __pow__
+
+Numbers built by the operators (Number._new) are counted as allocations
+but not timed. RuntimeErrors about incompatible dimensions are counted
+as mismatches. Times are inclusive: the time of construct includes the
+lookup and parse it triggers.
+
+    >>> from buckingham import Number, unit_cache
+    >>> unit_cache.clear()
+    >>> with profiling() as profiler:
+    ...     a = Number(1, 0, 'kilowatt*hour')
+    ...     b = a + Number(2, 0, 'kilowatt*hour')
+    ...     c = a.convert('joule')
+    >>> data = profiler.as_dict()
+    >>> data['counts']['construct'], data['allocations']
+    (2, 4)
+    >>> data['units']['kilowatt*hour']['parse']
+    1
+    >>> isinstance(Number.__dict__['__init__'], Wrapper)
+    False
+
+Setting the environment variable BUCKINGHAM_PROFILE before importing
+buckingham profiles the whole process and writes the report to stderr
+at exit, or as JSON to the file named by the variable if it is not "1".
+"""
+
+import atexit
+import json
+import sys
+import time
+
+import buckingham
+from buckingham import Converter, Fraction, Number, UnitCache
+
+__all__ = ['Profiler', 'profiling']
+
+# profilers currently recording, the wrappers are installed while not empty
+_active = []
+
+class Wrapper(object):
+    """ a wrapped function, callable in place of the original """
+    __slots__ = ('function', 'phase', 'key')
+
+    def __init__(self, function, phase, key=None):
+        self.function = function
+        self.phase = phase
+        self.key = key
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return lambda *args, **kwargs: self(instance, *args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        mismatch = False
+        try:
+            return self.function(*args, **kwargs)
+        except RuntimeError as e:
+            mismatch = str(e).startswith('Incompatible Dimen')
+            raise
+        finally:
+            elapsed = time.perf_counter()-start
+            key = self.key(args) if self.key else None
+            for profiler in _active:
+                profiler.record(self.phase, elapsed, key, mismatch)
+
+class Counter(object):
+    """ counts the calls of Number._new without timing them """
+    def __init__(self, function):
+        self.function = function
+
+    def __get__(self, instance, owner):
+        function = self.function
+        def _new(value, error, dims):
+            for profiler in _active:
+                profiler.allocations += 1
+            return function(owner, value, error, dims)
+        return _new
+
+def targets():
+    """ (owner, name, wrapper) of every function to instrument """
+    unit = lambda index: (lambda args: args[index])
+    items = [
+        (Number, '__init__', lambda f: Wrapper(f, 'construct')),
+        (UnitCache, 'lookup', lambda f: Wrapper(f, 'lookup', unit(1))),
+        (buckingham, 'parse_units', lambda f: Wrapper(f, 'parse', unit(0))),
+        (buckingham, 'buckingham', lambda f: Wrapper(f, 'buckingham')),
+        (Fraction, '__init__', lambda f: Wrapper(f, 'fraction')),
+        (Number, 'convert', lambda f: Wrapper(f, 'convert')),
+        (Converter, '__call__', lambda f: Wrapper(f, 'convert')),
+        (Number, '_new', lambda f: Counter(f.__func__)),
+        ]
+    for name in ('__add__', '__sub__', '__mul__', '__div__', '__truediv__',
+                 '__pow__'):
+        items.append((Number, name, lambda f: Wrapper(f, 'operators')))
+    return items
+
+_originals = []
+
+def install():
+    for owner, name, wrap in targets():
+        original = vars(owner)[name]
+        _originals.append((owner, name, original))
+        setattr(owner, name, wrap(original))
+
+def uninstall():
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner, name, original)
+
+class Profiler(object):
+    """
+    collects the counters and times of the instrumented functions
+    between start() and stop()
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.times = {}
+        self.units = {}
+        self.allocations = 0
+        self.mismatches = 0
+        self.elapsed = 0.0
+        self.started = None
+
+    def record(self, phase, elapsed, key, mismatch):
+        self.counts[phase] = self.counts.get(phase, 0)+1
+        self.times[phase] = self.times.get(phase, 0.0)+elapsed
+        if phase == 'construct':
+            self.allocations += 1
+        if mismatch:
+            self.mismatches += 1
+        if key is not None:
+            stats = self.units.get(key)
+            if stats is None:
+                stats = self.units[key] = dict(lookup=0, parse=0,
+                                               lookup_time=0.0, parse_time=0.0)
+            stats[phase] += 1
+            stats[phase+'_time'] += elapsed
+
+    def start(self):
+        if self in _active:
+            return self
+        if not _active:
+            install()
+        _active.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if not self in _active:
+            return self
+        _active.remove(self)
+        if not _active:
+            uninstall()
+        self.elapsed += time.perf_counter()-self.started
+        self.started = None
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def as_dict(self):
+        """ the collected data as plain types, ready for export """
+        elapsed = self.elapsed
+        if self.started is not None:
+            elapsed += time.perf_counter()-self.started
+        return dict(
+            elapsed=elapsed,
+            counts=dict(self.counts),
+            times=dict(self.times),
+            allocations=self.allocations,
+            allocations_per_second=self.allocations/elapsed if elapsed else 0.0,
+            mismatches=self.mismatches,
+            units=dict((key, dict(value)) for key, value in self.units.items()))
+
+    def report(self, top=10):
+        """ a human readable summary of as_dict() """
+        data = self.as_dict()
+        elapsed = data['elapsed'] or 1e-12
+        lines = ['profiled %.6fs, %i Numbers (%.0f/s), %i dimension mismatches'
+                 % (data['elapsed'], data['allocations'],
+                    data['allocations_per_second'], data['mismatches'])]
+        lines.append('  %-12s %10s %12s %7s' % ('phase', 'calls', 'seconds', '%'))
+        for phase in sorted(data['times'], key=lambda p: -data['times'][p]):
+            lines.append('  %-12s %10i %12.6f %6.1f%%' % (
+                    phase, data['counts'][phase], data['times'][phase],
+                    100.0*data['times'][phase]/elapsed))
+        units = sorted(data['units'].items(),
+                       key=lambda item: -item[1]['lookup_time'])
+        if units:
+            lines.append('  %-30s %8s %12s %6s %8s %12s %6s' % (
+                    'units', 'lookups', 'seconds', '%', 'parses', 'seconds', '%'))
+        for key, stats in units[:top]:
+            lines.append('  %-30s %8i %12.6f %5.1f%% %8i %12.6f %5.1f%%' % (
+                    key, stats['lookup'], stats['lookup_time'],
+                    100.0*stats['lookup_time']/elapsed,
+                    stats['parse'], stats['parse_time'],
+                    100.0*stats['parse_time']/elapsed))
+        return '\n'.join(lines)
+
+def profiling():
+    """ returns a new Profiler, to be used as a context manager """
+    return Profiler()
+
+def _from_environment(target):
+    """ profiles the whole process, as requested by BUCKINGHAM_PROFILE """
+    profiler = Profiler().start()
+    def dump():
+        profiler.stop()
+        if target == '1':
+            sys.stderr.write(profiler.report()+'\n')
+        else:
+            with open(target, 'w') as stream:
+                json.dump(profiler.as_dict(), stream, indent=1)
+    atexit.register(dump)
+    return profiler
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo uncertainty propagation (requires numpy)
+
+Linear propagation, as done by the operators of Number, is accurate
+only for formulas that are close to linear within the errors of their
+inputs. montecarlo() instead samples every uncertain input from
+Normal(value, error) and evaluates the formula on whole batches of
+samples at once, as NumberArrays, so the dimensions are checked once per
+operation and batch rather than once per sample.
+
+    >>> from buckingham import Number
+    >>> x = Number(2, 1, 'meter')
+    >>> result = montecarlo(lambda x: x*x, x, samples=200000, seed=1)
+    >>> result = result.convert('meter^2')
+    >>> print('%.1f ± %.1f' % (result.value, result.error))
+    5.0 ± 4.2
+
+Linear propagation would give 4 ± 4 here. Percentiles are returned as
+Numbers without error:
+
+    >>> result, p = montecarlo(lambda x: 2*x, x, samples=200000, seed=1,
+    ...                        percentiles=(50, 95))
+    >>> print('%.1f' % p[50].convert('meter').value)
+    4.0
+"""
+
+import numpy
+
+from buckingham import Number
+from buckingham.array import NumberArray
+
+__all__ = ['montecarlo']
+
+def batch_sizes(samples, batch):
+    """
+    >>> batch_sizes(25, 10)
+    [10, 10, 5]
+    """
+    sizes = [batch]*(samples//batch)
+    if samples % batch:
+        sizes.append(samples % batch)
+    return sizes
+
+def evaluate(args):
+    """
+    evaluates the formula on one batch of samples and returns
+    (dims, count, mean, sum of squared deviations, samples or None).
+    args is a single picklable tuple so that batches can be evaluated
+    by a process pool
+    """
+    formula, inputs, size, seed, keep = args
+    generator = numpy.random.default_rng(seed)
+    arguments = []
+    for x in inputs:
+        if isinstance(x, Number) and x.error:
+            values = x.value + x.error*generator.standard_normal(size)
+            arguments.append(NumberArray._new(values, numpy.zeros(size),
+                                              x.dims))
+        else:
+            arguments.append(x)
+    result = formula(*arguments)
+    if isinstance(result, NumberArray):
+        dims, values = result.dims, result.values
+    elif isinstance(result, Number):
+        dims, values = result.dims, numpy.full(size, result.value)
+    else:
+        raise RuntimeError("The formula must return a Number")
+    mean = values.mean()
+    return (dims, size, mean, ((values-mean)**2).sum(),
+            values if keep else None)
+
+def merge(a, b):
+    """
+    combines (count, mean, sum of squared deviations) of two sets of
+    samples (Chan et al.)
+    """
+    n, mean, m2 = a
+    m, other_mean, other_m2 = b
+    delta = other_mean-mean
+    total = n+m
+    return (total, mean+delta*m/total, m2+other_m2+delta**2*n*m/total)
+
+def montecarlo(formula, *inputs, **options):
+    """
+    propagates the errors of inputs through formula(*inputs) by sampling.
+    inputs are Numbers (sampled if they have an error) or plain values
+    (passed as they are). formula must work on NumberArrays, as
+    functions written with the Number operators and buckingham's
+    sin/cos/exp/log do.
+
+    options:
+      samples: total number of samples (default 100000)
+      batch: samples evaluated at once (default 100000)
+      seed: makes the result reproducible, whatever the number of workers
+      workers: evaluate the batches in a process pool of this size
+               (formula must then be picklable, i.e. a module-level function)
+      percentiles: if given, returns (Number, {percentile: Number})
+
+    returns a Number with the mean and standard deviation of the samples
+    """
+    samples = options.pop('samples', 100000)
+    batch = options.pop('batch', 100000)
+    seed = options.pop('seed', None)
+    workers = options.pop('workers', 0)
+    percentiles = options.pop('percentiles', None)
+    if options:
+        raise TypeError("Unknown options %s" % ', '.join(sorted(options)))
+    sizes = batch_sizes(samples, batch)
+    seeds = numpy.random.SeedSequence(seed).spawn(len(sizes))
+    keep = percentiles is not None
+    tasks = [(formula, inputs, size, s, keep) for size, s in zip(sizes, seeds)]
+    # the first batch checks the dimensions before any work is shipped
+    results = [evaluate(tasks[0])]
+    if workers and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        try:
+            results += pool.map(evaluate, tasks[1:])
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results += [evaluate(task) for task in tasks[1:]]
+    dims = results[0][0]
+    statistics = results[0][1:4]
+    for result in results[1:]:
+        statistics = merge(statistics, result[1:4])
+    count, mean, m2 = statistics
+    error = (m2/(count-1))**0.5 if count > 1 else 0.0
+    number = Number._new(float(mean), float(error), dims)
+    if not keep:
+        return number
+    values = numpy.concatenate([result[4] for result in results])
+    points = numpy.percentile(values, percentiles)
+    return number, dict((p, Number._new(float(v), 0.0, dims))
+                        for p, v in zip(percentiles, points))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of a formula over many records in a pool of processes
+
+Each record holds the inputs of the formula, each one a Number or a
+(value, error, units) tuple; a record that is a single (value, error,
+units) tuple is a formula of one input. Records are sent to the workers
+in chunks. The formula and the units to warm up are sent once, when the
+workers start, and each worker keeps its own unit cache for its whole
+life, so units are parsed once per worker and not once per task.
+
+    >>> def speed(distance, time):
+    ...     return (distance/time).convert('kilometer/hour')
+    >>> records = [((10, 1, 'mile'), (1, 0, 'hour')),
+    ...            ((5, 0, 'kilometer'), (30, 0, 'minute')),
+    ...            ((5, 0, 'kilometer'), (30, 0, 'meter'))]
+    >>> for result in map_evaluate(speed, records, chunksize=2):
+    ...     print(result)
+    (1.609 ± 0.161)x10
+    (10.000000 ± 0)
+    record 2: Incompatible Dimensions
+
+Results come back in the order of the records; a record that fails
+yields an EvaluationError instead of a Number.
+
+Malformed records fail on their own, without stopping the others
+
+    >>> results = map_evaluate(lambda x: x*2, [(None, 0, 'meter'),
+    ...                                        (1, 0, 5), (1, 0, 'meter')])
+    >>> [isinstance(result, EvaluationError) for result in results]
+    [True, True, False]
+
+Evaluations in this process (workers=0) are independent of each other
+
+    >>> g1 = map_evaluate(lambda x: x*2, [(1, 0, 'meter')]*2, chunksize=1)
+    >>> g2 = map_evaluate(lambda x: x*3, [(1, 0, 'meter')]*2, chunksize=1)
+    >>> print('%s %s %s' % (next(g1), next(g2), next(g1)))
+    (2.000000 ± 0) (3.000000 ± 0) (2.000000 ± 0)
+"""
+
+import itertools
+
+from buckingham import Number, unit_cache
+from buckingham.stream import imap_bounded
+
+__all__ = ['map_evaluate', 'EvaluationError']
+
+class EvaluationError(RuntimeError):
+    """ the error raised by the formula on one record """
+    def __init__(self, index, message):
+        # both arguments are kept in args so that it survives pickling
+        RuntimeError.__init__(self, index, message)
+        self.index = index
+        self.message = message
+
+    def __str__(self):
+        return 'record %i: %s' % (self.index, self.message)
+
+# the formula of a worker process, set once by initialize()
+_formula = []
+
+def initialize(formula, units=()):
+    """ runs once in each worker process of the pool """
+    del _formula[:]
+    _formula.append(formula)
+    for name in units:
+        unit_cache.lookup(name)
+
+def to_number(x):
+    if isinstance(x, Number):
+        return x
+    value, error, units = x
+    return Number(value, error, units)
+
+def evaluate_chunk(args, formula=None):
+    """
+    evaluates the formula (by default the one of the worker) on a chunk
+    of (index, record) pairs and returns a list of Numbers and
+    EvaluationErrors
+    """
+    if formula is None:
+        formula = _formula[0]
+    results = []
+    for index, record in args:
+        try:
+            if isinstance(record, Number) or (
+                    len(record) == 3 and not isinstance(record[0], (tuple, list, Number))):
+                record = (record,)
+            result = formula(*[to_number(x) for x in record])
+        except (RuntimeError, SyntaxError, ArithmeticError, ValueError,
+                TypeError) as e:
+            result = EvaluationError(index, str(e))
+        results.append(result)
+    return results
+
+def map_evaluate(formula, records, workers=0, chunksize=1000, units=(),
+                 window=None):
+    """
+    yields formula(*record) for each record, in order. with workers > 0
+    the chunks are evaluated by that many processes, each started once
+    with the formula and with the given units already parsed; with
+    workers = 0 they are evaluated in this process. at most window
+    chunks (default 2*workers) are in flight, so records can be a stream
+    larger than memory. with the default (fork) start method the formula
+    can be any callable; otherwise it must be picklable
+    """
+    indexed = enumerate(records)
+    chunks = iter(lambda: list(itertools.islice(indexed, chunksize)), [])
+    if not workers:
+        # the formula is passed along, so that generators running at the
+        # same time, in one thread or in several, do not share it
+        for name in units:
+            unit_cache.lookup(name)
+        for chunk in chunks:
+            for result in evaluate_chunk(chunk, formula):
+                yield result
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, initialize, (formula, tuple(units)))
+    try:
+        for results in imap_bounded(pool, evaluate_chunk, chunks,
+                                    window or 2*workers):
+            for result in results:
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
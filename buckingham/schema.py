@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Validation of the dimensions of the fields of incoming records
+
+A DimensionSchema maps field names to what each field must measure: a
+named quantity ('pressure', see buckingham.QUANTITIES), the units of an
+example ('meter/second'), a Dimension, or a list of the only unit
+strings accepted (a unit family). compile() returns a Validator, which
+checks each distinct unit string of a field once and remembers the
+verdict, so validating a record costs a few dict lookups and builds no
+Numbers. Problems are returned as FieldErrors, never raised.
+
+    >>> schema = DimensionSchema({'pressure': 'pressure',
+    ...                           'depth': ['meter', 'foot'],
+    ...                           'rate': 'liter/minute'})
+    >>> validator = schema.compile()
+    >>> factors, errors = validator.validate(
+    ...     {'pressure': (14.7, 0.1, 'psi'), 'depth': 'foot',
+    ...      'rate': (3, 0, 'meter^3/hour')})
+    >>> errors
+    []
+    >>> print('%.4f %.4f' % (factors['pressure'], factors['depth']))
+    6894757.2932 0.3048
+    >>> factors, errors = validator.validate(
+    ...     {'pressure': 'psi/second', 'depth': 'meter', 'rate': 'litre'})
+    >>> for error in errors:
+    ...     print('%s: %s' % (error.field, error.message))
+    pressure: 'psi/second' is not a pressure
+    rate: Unknown units 'litre' at position 0 in 'litre'
+    >>> validator.validate({'depth': 'yard'})[1][1].reason
+    'not allowed'
+    >>> for error in validator.validate({'pressure': 5, 'depth': (1, 0),
+    ...                                  'rate': ()})[1]:
+    ...     print('%s: %s' % (error.field, error.message))
+    pressure: 5 is not a unit string
+    depth: 0 is not a unit string
+    rate: None is not a unit string
+"""
+
+from collections import namedtuple
+
+from buckingham import Dimension, Number, QUANTITIES, quantity_index, \
+    unit_cache
+
+__all__ = ['DimensionSchema', 'Validator', 'FieldError']
+
+# reason is one of 'missing', 'invalid units', 'wrong dimensions' and
+# 'not allowed' (a unit outside the family of the field)
+FieldError = namedtuple('FieldError', 'field units reason message')
+
+QUANTITY_DIMS = dict((name, Dimension(dims)) for name, dims in QUANTITIES)
+
+class DimensionSchema(object):
+    """
+    the expected dimensions of the fields of a record. fields listed in
+    optional may be missing
+    """
+    def __init__(self, fields, optional=()):
+        self.fields = dict(fields)
+        self.optional = frozenset(optional)
+
+    def expected(self, field):
+        """ returns (Dimension, allowed unit strings or None) of a field """
+        spec = self.fields[field]
+        if isinstance(spec, Dimension):
+            return spec, None
+        if isinstance(spec, str):
+            if spec in QUANTITY_DIMS:
+                return QUANTITY_DIMS[spec], None
+            return unit_cache.lookup(spec)[1], None
+        spec = list(spec)
+        if spec and all(isinstance(units, str) for units in spec):
+            dims = set(unit_cache.lookup(units)[1] for units in spec)
+            if len(dims) > 1:
+                raise RuntimeError("The units of field %r have different "
+                                   "dimensions" % field)
+            return dims.pop(), frozenset(spec)
+        return Dimension(tuple(spec)), None
+
+    def compile(self, maxsize=1024):
+        """
+        returns a Validator. the schema itself is checked here, and
+        raises on unknown units
+        """
+        return Validator(dict((field, self.expected(field))
+                              for field in self.fields),
+                         self.optional, maxsize)
+
+class Validator(object):
+    """
+    validates records against a compiled DimensionSchema. a record maps
+    field names to unit strings, (..., units) tuples such as (value,
+    error, units), or Numbers. at most maxsize verdicts are kept per
+    field
+    """
+    def __init__(self, fields, optional=frozenset(), maxsize=1024):
+        self.fields = fields
+        self.required = [field for field in fields if not field in optional]
+        self.optional = [field for field in fields if field in optional]
+        self.maxsize = maxsize
+        self.verdicts = dict((field, {}) for field in fields)
+
+    def name(self, dims):
+        return quantity_index().guess(dims) or dims.units()
+
+    def check(self, field, units):
+        """
+        returns (factor to canonical units, FieldError or None) for a
+        unit string in a field, computed once per distinct string
+        """
+        verdicts = self.verdicts[field]
+        verdict = verdicts.get(units)
+        if verdict is None:
+            dims, allowed = self.fields[field]
+            if allowed is not None and not units in allowed:
+                verdict = (None, FieldError(
+                        field, units, 'not allowed', '%r is not one of %s' % (
+                            units, ', '.join(sorted(allowed)))))
+            else:
+                try:
+                    factor, found = unit_cache.lookup(units)
+                except (RuntimeError, SyntaxError) as e:
+                    verdict = (None, FieldError(field, units,
+                                                'invalid units', str(e)))
+                else:
+                    if found is dims:
+                        verdict = (factor, None)
+                    else:
+                        verdict = (None, FieldError(
+                                field, units, 'wrong dimensions',
+                                '%r is not a %s' % (units, self.name(dims))))
+            if len(verdicts) >= self.maxsize:
+                verdicts.clear()
+            verdicts[units] = verdict
+        return verdict
+
+    def validate(self, record):
+        """
+        returns ({field: factor to canonical units}, [FieldError]) for
+        the fields of the schema found in the record
+        """
+        factors, errors = {}, []
+        for fields, required in ((self.required, True),
+                                 (self.optional, False)):
+            for field in fields:
+                units = record.get(field)
+                if units is None:
+                    if required:
+                        errors.append(FieldError(field, None, 'missing',
+                                                 'missing field'))
+                    continue
+                if isinstance(units, Number):
+                    dims = self.fields[field][0]
+                    if units.dims is dims:
+                        factors[field] = 1.0
+                    else:
+                        errors.append(FieldError(
+                                field, units.units(), 'wrong dimensions',
+                                '%s is not a %s' % (units.units(),
+                                                    self.name(dims))))
+                    continue
+                if isinstance(units, (tuple, list)):
+                    units = units[-1] if units else None
+                if not isinstance(units, str):
+                    errors.append(FieldError(
+                            field, units, 'invalid units',
+                            '%r is not a unit string' % (units,)))
+                    continue
+                factor, error = self.check(field, units)
+                if error is None:
+                    factors[field] = factor
+                else:
+                    errors.append(error)
+        return factors, errors
+
+    def validate_many(self, records):
+        """
+        yields (factors, errors) for each record of an iterable, in order
+        """
+        validate = self.validate
+        for record in records:
+            yield validate(record)
+
+    def is_valid(self, record):
+        return not self.validate(record)[1]
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary storage of Numbers
+
+A file starts with a header and a table of the distinct dimensions
+used in it, followed by one fixed-width record per Number:
+
+    header   magic (8 bytes), version (uint16), reserved (uint16),
+             capacity of the dims table (uint32), used entries (uint32),
+             number of records (uint64)
+    dims     capacity x 6 int32, the exponents of each Dimension in
+             units of 1/Dimension.DENOMINATOR
+    records  value (float64), error (float64), dims id (uint16)
+
+all little endian and packed, so a record takes 18 bytes (a pickled
+Number takes ~100). Values and errors are in canonical units.
+
+    >>> import os, tempfile
+    >>> from buckingham import Number
+    >>> path = os.path.join(tempfile.mkdtemp(), 'numbers.bkn')
+    >>> with NumberWriter(path) as writer:
+    ...     writer.write(Number(1, 0.1, 'meter'))
+    ...     writer.write_many(Number(i, 0, 'second') for i in range(1000))
+    >>> numbers = NumberFile(path)
+    >>> len(numbers), len(numbers.dims)
+    (1001, 2)
+    >>> print(numbers[0].convert('centimeter'))
+    (1.000 ± 0.100)x10^2
+    >>> numbers[-1].units()
+    'second'
+    >>> sum(x.value for x in numbers[1:])
+    499500.0
+    >>> numbers.close()
+
+Records are read through mmap and a Number is only built when it is
+accessed. NumberFile.records() returns a numpy.memmap of the records,
+without copying, for vectorized work.
+"""
+
+import mmap
+import struct
+
+from buckingham import Dimension, Number
+
+__all__ = ['NumberWriter', 'NumberFile', 'dump', 'load', 'read']
+
+MAGIC = b'BKNUMBER'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIIQ')
+DIMS = struct.Struct('<6i')
+RECORD = struct.Struct('<ddH')
+MAX_DIMS = 65536
+
+class NumberWriter(object):
+    """
+    writes Numbers one at a time, with constant memory, to a path or to
+    a seekable binary file. the header is completed by close().
+    capacity is the number of distinct dims the file can hold
+    """
+    def __init__(self, target, capacity=256, buffer_size=4096):
+        if not 0 < capacity <= MAX_DIMS:
+            raise RuntimeError("capacity must be between 1 and %i" % MAX_DIMS)
+        if hasattr(target, 'write'):
+            self.stream, self.owned = target, False
+        else:
+            self.stream, self.owned = open(target, 'wb'), True
+        self.start = self.stream.tell()
+        self.capacity = capacity
+        self.buffer_size = buffer_size
+        self.ids = {}
+        self.dims = []
+        self.count = 0
+        self.buffer = []
+        self.stream.write(HEADER.pack(MAGIC, VERSION, 0, capacity, 0, 0))
+        self.stream.write(b'\0'*(DIMS.size*capacity))
+
+    def dims_id(self, dims):
+        i = self.ids.get(dims)
+        if i is None:
+            if len(self.dims) >= self.capacity:
+                raise RuntimeError("More than %i distinct dims, increase "
+                                   "the capacity" % self.capacity)
+            i = self.ids[dims] = len(self.dims)
+            self.dims.append(dims)
+        return i
+
+    def write(self, number):
+        self.buffer.append(RECORD.pack(number.value, number.error,
+                                       self.dims_id(number.dims)))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, numbers):
+        for number in numbers:
+            self.write(number)
+
+    def write_arrays(self, values, errors, dims):
+        """ writes a NumberArray-like set of values and errors sharing dims """
+        i = self.dims_id(dims)
+        for value, error in zip(values, errors):
+            self.buffer.append(RECORD.pack(value, error, i))
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        self.count += len(self.buffer)
+        self.stream.write(b''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        if self.stream is None:
+            return
+        self.flush()
+        end = self.stream.tell()
+        self.stream.seek(self.start)
+        self.stream.write(HEADER.pack(MAGIC, VERSION, 0, self.capacity,
+                                      len(self.dims), self.count))
+        self.stream.write(b''.join(DIMS.pack(*dims.exponents)
+                                   for dims in self.dims))
+        self.stream.seek(end)
+        if self.owned:
+            self.stream.close()
+        self.stream = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_header(data):
+    """ returns (capacity, dims, count, offset of the first record) """
+    magic, version, reserved, capacity, used, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise RuntimeError("Not a buckingham number file")
+    if version != VERSION:
+        raise RuntimeError("Unsupported version %i" % version)
+    dims = [Dimension._intern(DIMS.unpack_from(data, HEADER.size+DIMS.size*i))
+            for i in range(used)]
+    return capacity, dims, count, HEADER.size+DIMS.size*capacity
+
+class NumberFile(object):
+    """
+    a read-only, memory-mapped sequence of the Numbers in a file
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as stream:
+            self.mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        capacity, self.dims, self.count, self.offset = read_header(self.mmap)
+        if self.offset+RECORD.size*self.count > len(self.mmap):
+            raise RuntimeError("Truncated file")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("NumberFile index out of range")
+        value, error, d = RECORD.unpack_from(self.mmap,
+                                             self.offset+RECORD.size*i)
+        return Number._new(value, error, self.dims[d])
+
+    def __iter__(self):
+        dims = self.dims
+        view = memoryview(self.mmap)[
+            self.offset:self.offset+RECORD.size*self.count]
+        try:
+            for value, error, d in RECORD.iter_unpack(view):
+                yield Number._new(value, error, dims[d])
+        finally:
+            view.release()
+
+    def records(self):
+        """
+        the records as a numpy.memmap with fields value, error and dims
+        (an index into self.dims), without copying
+        """
+        import numpy
+        dtype = numpy.dtype([('value', '<f8'), ('error', '<f8'),
+                             ('dims', '<u2')])
+        return numpy.memmap(self.path, dtype=dtype, mode='r',
+                            offset=self.offset, shape=(self.count,))
+
+    def close(self):
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read(stream, chunksize=4096):
+    """
+    yields the Numbers of a binary file-like object (such as a pipe)
+    chunksize records at a time, without mmap
+
+    >>> import io
+    >>> from buckingham import Number
+    >>> stream = io.BytesIO()
+    >>> dump([Number(1, 0, 'hour'), Number(2, 0, 'meter')], stream)
+    >>> [x.units() for x in read(io.BytesIO(stream.getvalue()))]
+    ['second', 'meter']
+    """
+    header = stream.read(HEADER.size)
+    capacity = HEADER.unpack(header)[3]
+    capacity, dims, count, offset = read_header(
+        header+stream.read(DIMS.size*capacity))
+    while count:
+        n = min(count, chunksize)
+        data = stream.read(RECORD.size*n)
+        if len(data) != RECORD.size*n:
+            raise RuntimeError("Truncated file")
+        for value, error, d in RECORD.iter_unpack(data):
+            yield Number._new(value, error, dims[d])
+        count -= n
+
+def dump(numbers, target, capacity=256):
+    """ writes an iterable of Numbers to a path or binary file """
+    with NumberWriter(target, capacity) as writer:
+        writer.write_many(numbers)
+
+def load(path):
+    return NumberFile(path)
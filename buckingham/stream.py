@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming unit conversion of CSV and JSON-lines files
+
+Records are read in chunks of a fixed number of rows, converted and
+written out before the next chunk is read, so memory does not depend
+on the size of the input. Within a chunk the rows are grouped by unit
+and each group is rescaled with one precompiled converter.
+
+    >>> import io
+    >>> source = io.StringIO(u'value,error,unit\\n1,0.5,kilometer\\n2,0,meter\\n')
+    >>> target = io.StringIO()
+    >>> stats = convert_stream(source, target, 'meter', chunksize=1)
+    >>> print(target.getvalue().replace('\\r', ''))
+    value,error,unit
+    1000.0,500.0,meter
+    2.0,0.0,meter
+    <BLANKLINE>
+    >>> stats['rows'], stats['invalid']
+    (2, 0)
+
+This is also available from the command line as
+
+    python -m buckingham convert --to kilometer input.csv output.csv
+"""
+
+import collections
+import csv
+import itertools
+import json
+
+from buckingham import converter
+
+__all__ = ['convert_stream', 'convert_chunk', 'read_chunks']
+
+FORMATS = ('csv', 'jsonl')
+
+# (source, target) -> Converter, private to each process
+_converters = {}
+
+def get_converter(source, target):
+    key = (source, target)
+    value = _converters.get(key)
+    if value is None:
+        if len(_converters) > 10000:
+            _converters.clear()
+        value = _converters[key] = converter(source, target)
+    return value
+
+def read_chunks(stream, format='csv', chunksize=10000):
+    """
+    yields lists of at most chunksize records (dicts) read from stream.
+    for csv the first line is the header
+
+    >>> import io
+    >>> chunks = read_chunks(io.StringIO(u'{"value": 1}\\n\\n{"value": 2}\\n'),
+    ...                      'jsonl', chunksize=1)
+    >>> [[row['value'] for row in chunk] for chunk in chunks]
+    [[1], [2]]
+    """
+    if format == 'csv':
+        rows = csv.DictReader(stream)
+    elif format == 'jsonl':
+        rows = (json.loads(line) for line in stream if line.strip())
+    else:
+        raise RuntimeError("Unknown format %r" % format)
+    while True:
+        chunk = list(itertools.islice(rows, chunksize))
+        if not chunk:
+            break
+        yield chunk
+
+def convert_chunk(args):
+    """
+    converts the records of one chunk in place and returns
+    (records, errors) where errors is a list of (index, message).
+    args is (records, target, fields, default_unit) so that it can be
+    shipped to a worker process as a single picklable tuple
+
+    >>> rows = [{'value': '1', 'unit': 'hour'}, {'value': '1', 'unit': 'meter'}]
+    >>> rows, errors = convert_chunk((rows, 'minute', ('value', 'error', 'unit'), None))
+    >>> rows[0]['value'], errors
+    (60.0, [(1, 'Incompatible Dimensions')])
+
+    malformed rows are reported, not raised
+
+    >>> rows = [{'value': None, 'unit': 'hour'}, {'value': 1, 'unit': 5}]
+    >>> errors = convert_chunk((rows, 'minute', ('value', 'error', 'unit'), None))[1]
+    >>> [i for i, message in errors], errors[1][1]
+    ([0, 1], 'Invalid unit 5')
+    """
+    records, target, fields, default_unit = args
+    value_field, error_field, unit_field = fields
+    groups = collections.OrderedDict()
+    errors = []
+    for i, record in enumerate(records):
+        unit = record.get(unit_field) or default_unit
+        if not unit:
+            errors.append((i, 'Missing unit'))
+        elif not isinstance(unit, str):
+            errors.append((i, 'Invalid unit %r' % (unit,)))
+        else:
+            groups.setdefault(unit, []).append(i)
+    for unit, indices in groups.items():
+        try:
+            f = get_converter(unit, target)
+            values = f([float(records[i][value_field]) for i in indices])
+            uncertainties = f([float(records[i].get(error_field) or 0.0)
+                               for i in indices])
+        except (RuntimeError, SyntaxError, ValueError, KeyError, TypeError):
+            # report the rows one by one, only the bad ones are rejected
+            for i in indices:
+                record = records[i]
+                try:
+                    f = get_converter(unit, target)
+                    value = f(float(record[value_field]))
+                    error = f(float(record.get(error_field) or 0.0))
+                except (RuntimeError, SyntaxError, ValueError, KeyError,
+                        TypeError) as e:
+                    errors.append((i, str(e)))
+                    continue
+                record[value_field], record[error_field] = value, error
+                record[unit_field] = target
+            continue
+        for i, value, error in zip(indices, values, uncertainties):
+            record = records[i]
+            record[value_field], record[error_field] = value, error
+            record[unit_field] = target
+    errors.sort()
+    return records, errors
+
+def imap_bounded(pool, func, iterable, window):
+    """
+    like pool.imap but keeps at most window tasks in flight, so that
+    the input is not read ahead of the output. results are in order
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def convert_stream(source, target_stream, target, format='csv',
+                   chunksize=10000, workers=0, fields=('value', 'error', 'unit'),
+                   default_unit=None, skip_invalid=False, log=None):
+    """
+    reads records from source, converts their value and error columns
+    to the target units and writes them to target_stream in the same
+    format. rows that cannot be converted raise RuntimeError unless
+    skip_invalid is set, in which case they are reported to log (a
+    file-like object) and dropped. with workers > 0 the chunks are
+    converted by a process pool. returns a dict of counters
+    """
+    chunks = ((chunk, target, fields, default_unit)
+              for chunk in read_chunks(source, format, chunksize))
+    pool = None
+    if workers:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = imap_bounded(pool, convert_chunk, chunks, 2*workers)
+    else:
+        results = (convert_chunk(args) for args in chunks)
+    stats = dict(rows=0, invalid=0, chunks=0)
+    writer = None
+    try:
+        for records, errors in results:
+            if errors:
+                if not skip_invalid:
+                    i, message = errors[0]
+                    raise RuntimeError('Record %i: %s' % (stats['rows']+i+1,
+                                                          message))
+                for i, message in errors:
+                    if log:
+                        log.write('record %i: %s\n' % (stats['rows']+i+1,
+                                                       message))
+                bad = set(i for i, message in errors)
+            else:
+                bad = ()
+            if format == 'csv' and writer is None:
+                names = list(records[0].keys())
+                for name in fields:
+                    if not name in names:
+                        names.append(name)
+                writer = csv.DictWriter(target_stream, names)
+                writer.writeheader()
+            for i, record in enumerate(records):
+                if i in bad:
+                    continue
+                if format == 'csv':
+                    writer.writerow(record)
+                else:
+                    target_stream.write(json.dumps(record)+'\n')
+            stats['rows'] += len(records)
+            stats['invalid'] += len(errors)
+            stats['chunks'] += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return stats
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Columns of measurements in mixed units, backed by NumPy
+
+A MeasurementTable holds three columns: values and errors (float64, in
+canonical units) and a uint16 code per row that indexes a table of the
+Dimensions seen by this process. Rows of one column may be in meter,
+foot and mile, or have different dimensions altogether.
+
+Since values are canonical, the arithmetic on values and errors is one
+vectorized pass over all the rows; the dims of the result are computed
+once per distinct code (or pair of codes) and mapped back to the rows.
+Rows whose dims do not match (adding meters to seconds, converting a
+time to meters) are not an error: they are flagged in the mask column
+and their values become NaN. Reductions group the rows by code.
+
+    >>> t = MeasurementTable([1, 3, 1, 30], [0.1, 0.1, 0, 1],
+    ...                      ['kilometer', 'foot', 'mile', 'second'])
+    >>> km = t.convert('kilometer')
+    >>> km.mask.tolist()
+    [False, False, False, True]
+    >>> [round(x, 4) for x in km.values[:3].tolist()]
+    [1.0, 0.0009, 1.6093]
+    >>> totals = t.sum()
+    >>> print(totals[Number(1, 0, 'meter').dims].convert('meter'))
+    (2.610 ± 0.100)x10^3
+    >>> (t/Number(2, 0, 'second'))[0].units()
+    'meter*second^-1'
+"""
+
+import threading
+
+import numpy
+
+from buckingham import Dimension, Number, PURE, unit_cache
+
+__all__ = ['MeasurementTable']
+
+MAX_CODES = 65536
+
+# code -> Dimension and Dimension -> code, shared by all the tables of
+# the process, so codes of different tables can be compared directly
+_dims = [PURE]
+_codes = {PURE: 0}
+_lock = threading.Lock()
+
+def code(dims):
+    """ returns the code of a Dimension, assigning one if needed """
+    c = _codes.get(dims)
+    if c is None:
+        with _lock:
+            c = _codes.get(dims)
+            if c is None:
+                if len(_dims) >= MAX_CODES:
+                    raise RuntimeError("More than %i distinct dims" % MAX_CODES)
+                c = len(_dims)
+                _dims.append(dims)
+                _codes[dims] = c
+    return c
+
+def map_codes(codes, function):
+    """
+    applies function(Dimension) -> Dimension to a column of codes,
+    calling it once per distinct code
+    """
+    present = numpy.flatnonzero(numpy.bincount(codes, minlength=1))
+    mapping = numpy.zeros(present[-1]+1 if len(present) else 1,
+                          dtype=numpy.uint16)
+    for c in present:
+        mapping[c] = code(function(_dims[c]))
+    return mapping[codes]
+
+def combine_codes(a, b, function):
+    """
+    applies function(Dimension, Dimension) -> Dimension to two columns
+    of codes, calling it once per distinct pair
+    """
+    n = len(_dims)
+    key = a.astype(numpy.int64)*n+b
+    pairs, inverse = numpy.unique(key, return_inverse=True)
+    mapping = numpy.array([code(function(_dims[p//n], _dims[p % n]))
+                           for p in pairs.tolist()], dtype=numpy.uint16)
+    return mapping[inverse]
+
+class MeasurementTable(object):
+
+    # makes numpy defer to the reflected operators of MeasurementTable
+    __array_ufunc__ = None
+
+    def __init__(self, values, errors=0.0, units='N'):
+        """
+        units is one unit string for all the rows or one per row. each
+        distinct string is parsed once; rows with invalid units (or with
+        anything other than a string or a Dimension) are masked
+
+        >>> t = MeasurementTable([1, 2, 3], 0, ['meter', None, 'meters'])
+        >>> t.mask.tolist()
+        [False, True, True]
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        errors = numpy.broadcast_to(
+            numpy.asarray(errors, dtype=numpy.float64), values.shape)
+        if isinstance(units, (str, Dimension)):
+            names, inverse = [units], numpy.zeros(len(values), dtype=numpy.intp)
+        else:
+            # anything that is not a string or a Dimension becomes None,
+            # which is invalid units
+            index = {}
+            inverse = numpy.array(
+                [index.setdefault(name if isinstance(name, (str, Dimension))
+                                  else None, len(index)) for name in units],
+                dtype=numpy.intp)
+            names = list(index)
+        scales = numpy.empty(len(names))
+        codes = numpy.empty(len(names), dtype=numpy.uint16)
+        invalid = numpy.zeros(len(names), dtype=bool)
+        for i, name in enumerate(names):
+            try:
+                if isinstance(name, Dimension):
+                    n, dims = 1.0, name
+                elif name is None:
+                    raise RuntimeError("Invalid units")
+                else:
+                    n, dims = unit_cache.lookup(name)
+            except (RuntimeError, SyntaxError):
+                n, dims, invalid[i] = numpy.nan, PURE, True
+            scales[i], codes[i] = n, code(dims)
+        scales = scales[inverse]
+        self.values = values*scales
+        self.errors = errors*scales
+        self.codes = codes[inverse]
+        self.mask = invalid[inverse]
+
+    @classmethod
+    def _new(cls, values, errors, codes, mask):
+        """ builds a table from columns already in canonical units """
+        self = cls.__new__(cls)
+        self.values = values
+        self.errors = errors
+        self.codes = codes
+        self.mask = mask
+        return self
+
+    def _masked(self, values, errors, codes, mask):
+        if mask.any():
+            values = numpy.where(mask, numpy.nan, values)
+            errors = numpy.where(mask, numpy.nan, errors)
+        return MeasurementTable._new(values, errors, codes, mask)
+
+    @classmethod
+    def from_numbers(cls, numbers):
+        """
+        >>> t = MeasurementTable.from_numbers([Number(1, 0.1, 'meter'),
+        ...                                    Number(2, 0, 'hour')])
+        >>> print(t[1].convert('minute'))
+        (120.000000 ± 0)
+        """
+        numbers = list(numbers)
+        values = numpy.array([x.value for x in numbers], dtype=numpy.float64)
+        errors = numpy.array([x.error for x in numbers], dtype=numpy.float64)
+        codes = numpy.array([code(x.dims) for x in numbers], dtype=numpy.uint16)
+        return cls._new(values, errors, codes, numpy.zeros(len(numbers), bool))
+
+    @classmethod
+    def from_file(cls, numbers):
+        """
+        the records of a buckingham.storage.NumberFile, read through
+        its memmap. their dims ids are mapped to codes once per id
+        """
+        records = numbers.records()
+        mapping = numpy.array([code(dims) for dims in numbers.dims] or [0],
+                              dtype=numpy.uint16)
+        return cls._new(numpy.array(records['value']),
+                        numpy.array(records['error']),
+                        mapping[records['dims']],
+                        numpy.zeros(len(records), dtype=bool))
+
+    def __reduce__(self):
+        # codes are local to a process, so the Dimensions travel along
+        present = numpy.flatnonzero(numpy.bincount(self.codes, minlength=1))
+        local = numpy.zeros(len(_dims), dtype=numpy.uint16)
+        local[present] = numpy.arange(len(present))
+        exponents = [_dims[c].exponents for c in present]
+        return (_restore, (self.values, self.errors, local[self.codes],
+                           exponents, self.mask))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        """
+        yields a Number (None if masked) per row
+
+        >>> from buckingham import format_numbers
+        >>> t = MeasurementTable([1, 2], [0.1, 0.1], 'meter')
+        >>> list(format_numbers(t, units=True))
+        ['1.000 ± 0.100 meter', '2.000 ± 0.100 meter']
+        """
+        for i in range(len(self.values)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        """ a Number (None if masked) or, for slices and masks, a table """
+        if isinstance(key, (int, numpy.integer)):
+            if self.mask[key]:
+                return None
+            return Number._new(float(self.values[key]),
+                               float(self.errors[key]),
+                               _dims[self.codes[key]])
+        return MeasurementTable._new(self.values[key], self.errors[key],
+                                     self.codes[key], self.mask[key])
+
+    def to_numbers(self):
+        return [self[i] for i in range(len(self.values))]
+
+    def dims(self):
+        """ the distinct Dimensions of the unmasked rows """
+        counts = numpy.bincount(self.codes[~self.mask], minlength=1)
+        return [_dims[c] for c in numpy.flatnonzero(counts)]
+
+    def _operand(self, other):
+        """
+        returns (values, errors, codes or Dimension, mask) of other;
+        plain numbers and arrays are exact and pure
+        """
+        if isinstance(other, MeasurementTable):
+            if len(other) != len(self):
+                raise ValueError("Tables of different lengths")
+            return other.values, other.errors, other.codes, other.mask
+        if isinstance(other, Number):
+            return other.value, other.error, other.dims, False
+        return numpy.asarray(other, dtype=numpy.float64), 0.0, PURE, False
+
+    def _same(self, dims):
+        """ the rows whose dims are dims (a Dimension or codes) """
+        if isinstance(dims, Dimension):
+            return self.codes == code(dims)
+        return self.codes == dims
+
+    def _codes(self, dims, function):
+        """ the codes of function(dims of each row, dims) """
+        if isinstance(dims, Dimension):
+            return map_codes(self.codes, lambda d: function(d, dims))
+        return combine_codes(self.codes, dims, function)
+
+    def __add__(self, other):
+        """
+        >>> t = MeasurementTable([1, 1], 0.1, ['meter', 'second'])
+        >>> s = t + Number(1, 0.1, 'foot')
+        >>> s.mask.tolist(), round(float(s.values[0]), 4)
+        ([False, True], 1.3048)
+        """
+        b, db, dims, mask = self._operand(other)
+        a, da = self.values, self.errors
+        dc = 2.0*da if self is other else numpy.hypot(da, db)
+        mask = self.mask | mask | ~self._same(dims)
+        return self._masked(a+b, dc, self.codes, mask)
+
+    def __radd__(self, other):
+        return self+other
+
+    def __sub__(self, other):
+        b, db, dims, mask = self._operand(other)
+        a, da = self.values, self.errors
+        dc = numpy.zeros_like(da) if self is other else numpy.hypot(da, db)
+        mask = self.mask | mask | ~self._same(dims)
+        return self._masked(a-b, dc, self.codes, mask)
+
+    def __rsub__(self, other):
+        x = self-other
+        return MeasurementTable._new(-x.values, x.errors, x.codes, x.mask)
+
+    def __mul__(self, other):
+        b, db, dims, mask = self._operand(other)
+        a, da = self.values, self.errors
+        if self is other:
+            dc = 2.0*numpy.abs(da*a)
+        else:
+            dc = numpy.hypot(da*b, db*a)
+        codes = self._codes(dims, lambda x, y: x*y)
+        return self._masked(a*b, dc, codes, self.mask | mask)
+
+    def __rmul__(self, other):
+        return self*other
+
+    def __div__(self, other):
+        b, db, dims, mask = self._operand(other)
+        a, da = self.values, self.errors
+        if self is other:
+            dc = numpy.zeros_like(da)
+        else:
+            dc = numpy.hypot(da/b, (a*db)/(b*b))
+        codes = self._codes(dims, lambda x, y: x/y)
+        return self._masked(a/b, dc, codes, self.mask | mask)
+
+    def __rdiv__(self, other):
+        """
+        >>> (1/MeasurementTable([2, 4], 0, 'second'))[1].units()
+        'second^-1'
+        """
+        b, db, dims, mask = self._operand(other)
+        a, da = self.values, self.errors
+        dc = numpy.hypot(db/a, (b*da)/(a*a))
+        codes = map_codes(self.codes, lambda d: dims/d)
+        return self._masked(b/a, dc, codes, self.mask | mask)
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        """
+        the exponent must be an exact pure scalar
+
+        >>> (MeasurementTable([0, 2], 0, 'meter')**2).errors.tolist()
+        [0.0, 0.0]
+        """
+        if isinstance(other, Number):
+            if not other.is_pure() or other.error:
+                raise RuntimeError("The exponent must be an exact pure number")
+            other = other.value
+        b = float(other)
+        a, da = self.values, self.errors
+        c = a**b
+        # exact rows propagate no error, also where the value is 0
+        exact = da == 0
+        dc = numpy.abs(c*numpy.where(exact, 0.0,
+                                     da*b/numpy.where(exact, 1.0, a)))
+        codes = map_codes(self.codes, lambda d: d**b)
+        return self._masked(c, dc, codes, self.mask)
+
+    def __neg__(self):
+        return MeasurementTable._new(-self.values, self.errors, self.codes,
+                                     self.mask)
+
+    def convert(self, units):
+        """
+        a table of pure values in the given units. rows with other
+        dims are masked
+        """
+        n, dims = unit_cache.lookup(units)
+        mask = self.mask | ~self._same(dims)
+        return self._masked(self.values/n, self.errors/n,
+                            numpy.zeros_like(self.codes), mask)
+
+    def _group(self, weights):
+        valid = ~self.mask
+        return numpy.bincount(self.codes[valid], weights=weights[valid],
+                              minlength=1)
+
+    def count(self):
+        """ {Dimension: number of unmasked rows} """
+        counts = numpy.bincount(self.codes[~self.mask], minlength=1)
+        return dict((_dims[c], int(counts[c])) for c in numpy.flatnonzero(counts))
+
+    def sum(self):
+        """
+        {Dimension: sum of the unmasked rows with those dims}, one
+        pass over all the rows. errors are combined in quadrature
+        """
+        counts = numpy.bincount(self.codes[~self.mask], minlength=1)
+        values = self._group(self.values)
+        errors = numpy.sqrt(self._group(self.errors**2))
+        return dict((_dims[c], Number._new(float(values[c]), float(errors[c]),
+                                           _dims[c]))
+                    for c in numpy.flatnonzero(counts))
+
+    def mean(self):
+        """ {Dimension: mean of the unmasked rows with those dims} """
+        counts = self.count()
+        return dict((dims, Number._new(x.value/counts[dims],
+                                       x.error/counts[dims], dims))
+                    for dims, x in self.sum().items())
+
+    def split(self):
+        """ {Dimension: NumberArray of the unmasked rows with those dims} """
+        from buckingham.array import NumberArray
+        valid = ~self.mask
+        groups = {}
+        for c in numpy.flatnonzero(numpy.bincount(self.codes[valid],
+                                                  minlength=1)):
+            rows = valid & (self.codes == c)
+            groups[_dims[c]] = NumberArray._new(self.values[rows],
+                                                self.errors[rows], _dims[c])
+        return groups
+
+    def __repr__(self):
+        return '<MeasurementTable %i rows, %i dims, %i masked>' % (
+            len(self.values), len(self.dims()), int(self.mask.sum()))
+
+def _restore(values, errors, local, exponents, mask):
+    mapping = numpy.array([code(Dimension._intern(e)) for e in exponents]
+                          or [0], dtype=numpy.uint16)
+    return MeasurementTable._new(values, errors, mapping[local], mask)
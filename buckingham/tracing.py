@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+Compiles formulas written with Numbers into float-only kernels
+
+compile_formula(func, **input_units) calls func once on symbolic
+inputs. The dimensions are checked during this trace, exactly as the
+Number operators would check them, and every operation records how its
+value and error are computed. The trace becomes a plain Python function
+of the input values and errors, expressed in the given units, that
+returns the value and error of the result in canonical units (or in
+the units passed to convert()). It does no work on dimensions and
+allocates no Numbers, and accepts floats or numpy arrays.
+
+    >>> from buckingham import Number
+    >>> g = Number(9.81, 0, 'meter/second^2')
+    >>> def energy(m, v, h):
+    ...     return 0.5*m*v**2 + m*g*h
+    >>> kernel = compile_formula(energy, m='kilogram', v='kilometer/hour',
+    ...                          h='meter').convert('joule')
+    >>> value, error = kernel(2.0, (36.0, 3.6), 1.0)
+    >>> print('%.2f %.2f' % (value, error))
+    119.62 20.00
+
+The kernel follows the propagation rules of Number, so it returns the
+same result as the formula evaluated on Numbers:
+
+    >>> e = energy(Number(2.0, 0, 'kilogram'), Number(36, 3.6, 'kilometer/hour'),
+    ...            Number(1.0, 0, 'meter')).convert('joule')
+    >>> print('%.2f %.2f' % (e.value, e.error))
+    119.62 20.00
+
+    >>> compile_formula(lambda x: x**2, x='meter')(0.0)
+    (0.0, 0.0)
+
+    >>> compile_formula(lambda m, h: m+h, m='kilogram', h='meter')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Incompatible Dimensions
+"""
+
+import math
+
+from buckingham import Dimension, Number, PURE, unit_cache
+
+__all__ = ['compile_formula', 'Kernel']
+
+class Expr(object):
+    """
+    a node of the traced computation of a value or of an error. the
+    operators fold constants, so exact quantities cost nothing
+    """
+    __slots__ = ('op', 'args')
+
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+
+    @staticmethod
+    def make(op, a, b):
+        a_const, b_const = not isinstance(a, Expr), not isinstance(b, Expr)
+        if a_const and b_const:
+            return OPERATORS[op](a, b)
+        if op == '+':
+            if a_const and a == 0:
+                return b
+            if b_const and b == 0:
+                return a
+        elif op == '-':
+            if b_const and b == 0:
+                return a
+        elif op == '*':
+            if (a_const and a == 0) or (b_const and b == 0):
+                return 0.0
+            if a_const and a == 1:
+                return b
+            if b_const and b == 1:
+                return a
+        elif op == '/':
+            if a_const and a == 0:
+                return 0.0
+            if b_const and b == 1:
+                return a
+        elif op == '**':
+            if b_const and b == 1:
+                return a
+            if b_const and b == 2 and not a_const:
+                # the squares of sqrt(x) and abs(x) in the error formulas
+                if a.op == 'sqrt':
+                    return a.args[0]
+                if a.op == 'abs':
+                    return Expr.make('**', a.args[0], b)
+        return Expr(op, a, b)
+
+    def __add__(self, other):
+        return Expr.make('+', self, other)
+
+    def __radd__(self, other):
+        return Expr.make('+', other, self)
+
+    def __sub__(self, other):
+        return Expr.make('-', self, other)
+
+    def __rsub__(self, other):
+        return Expr.make('-', other, self)
+
+    def __mul__(self, other):
+        return Expr.make('*', self, other)
+
+    def __rmul__(self, other):
+        return Expr.make('*', other, self)
+
+    def __div__(self, other):
+        return Expr.make('/', self, other)
+
+    def __rdiv__(self, other):
+        return Expr.make('/', other, self)
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        return Expr.make('**', self, other)
+
+    def __rpow__(self, other):
+        return Expr.make('**', other, self)
+
+    def __neg__(self):
+        return Expr.make('-', 0.0, self)
+
+    def __abs__(self):
+        return Expr('abs', self)
+
+    # called by buckingham's sin/cos/exp/log on non-Number arguments
+    def sin(self):
+        return Expr('sin', self)
+
+    def cos(self):
+        return Expr('cos', self)
+
+    def exp(self):
+        return Expr('exp', self)
+
+    def log(self):
+        return Expr('log', self)
+
+    def sqrt(self):
+        return Expr('sqrt', self)
+
+OPERATORS = {
+    '+': lambda a, b: a+b,
+    '-': lambda a, b: a-b,
+    '*': lambda a, b: a*b,
+    '/': lambda a, b: a/b,
+    '**': lambda a, b: a**b,
+    }
+
+def sqrt(x):
+    if not isinstance(x, Expr):
+        return math.sqrt(x)
+    if x.op == '**' and x.args[1] == 2:
+        return abs(x.args[0])
+    return x.sqrt()
+
+def log(x):
+    return x.log() if isinstance(x, Expr) else math.log(x)
+
+def ratio(x, y):
+    """ x/y, but 0 where x is 0 (even if y is 0) """
+    if isinstance(x, Expr):
+        return Expr('ratio', x, y)
+    return x/y if x else 0.0
+
+def numpy_ratio(x, y):
+    import numpy
+    exact = numpy.equal(x, 0)
+    return numpy.where(exact, 0.0, x/numpy.where(exact, 1.0, y))
+
+class Symbol(Number):
+    """
+    a Number whose value and error are Exprs (or constants). its
+    operators mirror those of Number and check dims in the same way
+    """
+    __slots__ = ()
+
+    @classmethod
+    def _operand(cls, other, dims):
+        if isinstance(other, Number):
+            return other
+        if isinstance(other, Expr):
+            return cls._new(other, 0.0, dims)
+        try:
+            return cls._new(float(other), 0.0, dims)
+        except TypeError:
+            return None
+
+    def __add__(self, other):
+        other = self._operand(other, self.dims)
+        if other is None:
+            return NotImplemented
+        if self.dims is not other.dims:
+            raise RuntimeError("Incompatible Dimensions")
+        a, da = self.value, self.error
+        b, db = other.value, other.error
+        if not self is other:
+            dc = sqrt(da**2+db**2) if da and db else abs(da or db)
+        else:
+            dc = 2.*da
+        return Symbol._new(a+b, dc, self.dims)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = self._operand(other, self.dims)
+        if other is None:
+            return NotImplemented
+        if self.dims is not other.dims:
+            raise RuntimeError("Incompatible Dimensions")
+        a, da = self.value, self.error
+        b, db = other.value, other.error
+        if not self is other:
+            dc = sqrt(da**2+db**2) if da and db else abs(da or db)
+        else:
+            dc = 0.0
+        return Symbol._new(a-b, dc, self.dims)
+
+    def __rsub__(self, other):
+        other = self._operand(other, self.dims)
+        if other is None:
+            return NotImplemented
+        return other-self
+
+    def __mul__(self, other):
+        other = self._operand(other, PURE)
+        if other is None:
+            return NotImplemented
+        a, da = self.value, self.error
+        b, db = other.value, other.error
+        if not self is other:
+            dc = sqrt((da*b)**2+(db*a)**2)
+        else:
+            dc = 2.0*da*a
+        return Symbol._new(a*b, dc, self.dims*other.dims)
+
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        other = self._operand(other, PURE)
+        if other is None:
+            return NotImplemented
+        a, da = self.value, self.error
+        b, db = other.value, other.error
+        if not self is other:
+            dc = sqrt((da/b)**2+((a*db)/(b*b))**2)
+        else:
+            dc = 0.0
+        return Symbol._new(a/b, dc, self.dims/other.dims)
+
+    def __rdiv__(self, other):
+        other = self._operand(other, PURE)
+        if other is None:
+            return NotImplemented
+        return other/self
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        other = self._operand(other, PURE)
+        if other is None:
+            return NotImplemented
+        elif not other.is_pure():
+            raise RuntimeError("Incompatible Dimentions")
+        a, da = self.value, self.error
+        b, db = other.value, other.error
+        if isinstance(b, Expr):
+            if not self.is_pure():
+                raise RuntimeError("The exponent of a dimensional "
+                                   "quantity must be a constant")
+            dims = PURE
+        else:
+            dims = self.dims**b
+        c = a**b
+        # the logarithm only enters if the exponent is uncertain, and an
+        # exact base has no relative error, even where its value is 0
+        if not self is other:
+            dc = abs(c)*sqrt((ratio(da, a)*b)**2+(db*log(a) if db else 0.0)**2)
+        else:
+            dc = abs(c)*(abs(ratio(da, a)*b)+db*log(a))
+        return Symbol._new(c, dc, dims)
+
+    def _apply(self, value, derivative):
+        return Symbol._new(value, abs(derivative)*self.error, self.dims)
+
+    def convert(self, dims):
+        n, dims = unit_cache.lookup(dims)
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        return Symbol._new(self.value/n, self.error/n, PURE)
+
+    def purify(self, force=False):
+        if not force and not self.is_pure():
+            raise RuntimeError("Try purify(force = True)")
+        return Symbol._new(self.value, self.error, PURE)
+
+def generate(names, outputs):
+    """
+    returns the source of a function of (value, error) of each input
+    that computes the outputs, one statement per distinct Expr node
+    """
+    lines, temps = [], {}
+    def emit(x):
+        if not isinstance(x, Expr):
+            return repr(float(x))
+        key = id(x)
+        if key in temps:
+            return temps[key]
+        if x.op == 'input':
+            return x.args[0]
+        args = [emit(arg) for arg in x.args]
+        if x.op in OPERATORS:
+            code = '%s %s %s' % (args[0], x.op, args[1])
+        else:
+            code = '%s(%s)' % (x.op, ', '.join(args))
+        temps[key] = name = '_t%i' % len(temps)
+        lines.append('    %s = %s' % (name, code))
+        return name
+    results = [emit(x) for x in outputs]
+    arguments = ', '.join('_in%i, _in%i_error' % (i, i)
+                          for i in range(len(names)))
+    return 'def kernel(%s):\n%s\n    return %s\n' % (
+        arguments, '\n'.join(lines), ', '.join(results))
+
+class Kernel(object):
+    """
+    the compiled formula. call it with one argument per input, in the
+    order of the input units, each a value or a (value, error) pair of
+    floats or numpy arrays. returns (value, error)
+    """
+    def __init__(self, names, value, error, dims, target=None):
+        self.names = names
+        self.dims = dims
+        self.target = target
+        self.source = generate(names, (value, error))
+        self.trace = (value, error)
+        self.functions = {}
+
+    def function(self, module):
+        function = self.functions.get(module)
+        if function is None:
+            if module == 'math':
+                namespace = dict(sqrt=math.sqrt, sin=math.sin, cos=math.cos,
+                                 exp=math.exp, log=math.log, ratio=ratio)
+            else:
+                import numpy
+                namespace = dict(sqrt=numpy.sqrt, sin=numpy.sin,
+                                 cos=numpy.cos, exp=numpy.exp, log=numpy.log,
+                                 ratio=numpy_ratio)
+            exec(self.source, namespace)
+            function = self.functions[module] = namespace['kernel']
+        return function
+
+    def __call__(self, *args):
+        if len(args) != len(self.names):
+            raise TypeError("Expected %i inputs (%s)" % (
+                    len(self.names), ', '.join(self.names)))
+        arguments, module = [], 'math'
+        for arg in args:
+            value, error = arg if isinstance(arg, tuple) else (arg, 0.0)
+            if not isinstance(value, (int, float)) or \
+                    not isinstance(error, (int, float)):
+                module = 'numpy'
+            arguments += [value, error]
+        return self.function(module)(*arguments)
+
+    def convert(self, dims):
+        """ returns a kernel whose results are in the given units """
+        n, dims = unit_cache.lookup(dims)
+        if self.dims is not dims:
+            raise RuntimeError("Incompatible Dimensions")
+        value, error = self.trace
+        return Kernel(self.names, value/n, error/n, PURE, dims)
+
+    def units(self):
+        return self.dims.units()
+
+    def __repr__(self):
+        return '<Kernel (%s) -> %s>' % (', '.join(self.names),
+                                        self.target or self.units())
+
+def compile_formula(func, **input_units):
+    """
+    traces func(**inputs) once with symbolic inputs in the given units
+    and returns a Kernel. the units may be strings, Dimensions or dims
+    tuples (canonical units)
+
+    >>> kernel = compile_formula(lambda t1, t0, sqrt: (t1*t1+t0)*t1/sqrt,
+    ...                          t1='meter', t0='meter^2', sqrt='meter^3')
+    >>> print('%.2f %.4f' % kernel((2, 0.1), (3, 0.2), 1.0))
+    14.00 1.1358
+    """
+    names = list(input_units)
+    symbols = {}
+    # the kernel names its arguments by position and its temporaries
+    # with a prefix, so they cannot clash with the names of the inputs
+    for i, name in enumerate(names):
+        units = input_units[name]
+        if isinstance(units, (Dimension, tuple)):
+            n, dims = 1.0, Dimension(units)
+        else:
+            n, dims = unit_cache.lookup(units)
+        symbols[name] = Symbol._new(Expr('input', '_in%i' % i)*n,
+                                    Expr('input', '_in%i_error' % i)*n, dims)
+    result = func(**symbols)
+    if not isinstance(result, Number):
+        raise RuntimeError("The formula must return a Number")
+    return Kernel(names, result.value, result.error, result.dims)
@@ -14,6 +14,9 @@ setuptools.setup(
     maintainer_email = 'massimo.dipierro@gmail.com',
     description = 'a library for unit conversion and error propagation',
     packages = ['buckingham'],
+    package_data = {'buckingham': ['benchmarks.json']},
+    # NumberArray, MeasurementTable and montecarlo
+    extras_require = {'array': ['numpy']},
     include_package_data = True,
     zip_safe = False,
     platforms = 'any',